@@ -4,6 +4,17 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+import sys
+from pathlib import Path
+
+# 共通モジュール（apps/common）を参照できるようにする
+APPS_DIR = str(Path(__file__).resolve().parent.parent)
+if APPS_DIR not in sys.path:
+    sys.path.insert(0, APPS_DIR)
+
+from common import bounded_cache, instrumentation, session_budget
+
+from binning import BIN_METHODS, FIXED_BINS, MAX_BINS, compute_histogram
 
 # Streamlitアプリの設定
 st.set_page_config(
@@ -12,6 +23,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+instrumentation.configure("app1")
+session_budget.track("app1")
 
 # カスタムCSS
 st.markdown("""
@@ -53,15 +66,11 @@ with st.sidebar:
     start_date = st.date_input("開始日", datetime.now() - timedelta(days=30))
     end_date = st.date_input("終了日", datetime.now())
     
-    # グラフタイプ
-    chart_type = st.selectbox(
-        "グラフタイプ",
-        ["線グラフ", "棒グラフ", "散布図", "ヒートマップ"]
-    )
+    session_budget.render_report()
 
-# データ生成
-@st.cache_data
-def generate_sample_data(n_points, categories):
+# データ生成（期間もキャッシュキーに含める）
+@bounded_cache.cache_data("generate_sample_data")
+def generate_sample_data(n_points, categories, start_date, end_date):
     """サンプルデータ生成"""
     np.random.seed(42)
     dates = pd.date_range(start=start_date, end=end_date, periods=n_points)
@@ -79,40 +88,27 @@ def generate_sample_data(n_points, categories):
     
     return pd.DataFrame(data)
 
-if categories:
-    df = generate_sample_data(data_points, categories)
-    
-    # メトリクス表示
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        if "売上" in categories:
-            total_sales = df["売上"].sum()
-            st.metric("💰 総売上", f"¥{total_sales:,.0f}")
-    
-    with col2:
-        if "利益" in categories:
-            total_profit = df["利益"].sum()
-            st.metric("💎 総利益", f"¥{total_profit:,.0f}")
-    
-    with col3:
-        if "顧客数" in categories:
-            avg_customers = df["顧客数"].mean()
-            st.metric("👥 平均顧客数", f"{avg_customers:.0f}人")
-    
-    with col4:
-        if "製品数" in categories:
-            avg_products = df["製品数"].mean()
-            st.metric("📦 平均製品数", f"{avg_products:.0f}個")
-    
-    st.markdown("---")
-    
-    # グラフ表示
-    col_chart, col_table = st.columns([2, 1])
+# ヒストグラムのビン集計（データセット・列・ビン指定ごとにキャッシュ）
+@bounded_cache.cache_data("histogram_bins")
+def histogram_bins(n_points, categories, start_date, end_date, column, method, bins):
+    """サーバー側でビンごとの件数を集計する"""
+    df = generate_sample_data(n_points, categories, start_date, end_date)
+    return compute_histogram(df[column].to_numpy(), method, bins)
+
+# 以下の各セクションは st.fragment で、セクション内のウィジェット操作ではそのセクションだけが
+# 再実行される。サイドバーの設定（データポイント数・カテゴリー・期間）は引数として明示的に渡し、
+# データ本体はキャッシュから取り出す（変更されたときはページ全体がリランされる）
+@instrumentation.fragment("main_chart")
+def main_chart_section(n_points, categories, start_date, end_date):
+    """メイングラフ（グラフタイプの切り替えはこのセクションだけを再実行する）"""
+    chart_type = st.selectbox(
+        "グラフタイプ",
+        ["線グラフ", "棒グラフ", "散布図", "ヒートマップ"]
+    )
+    st.subheader(f"📈 {chart_type}")
+    df = generate_sample_data(n_points, categories, start_date, end_date)
     
-    with col_chart:
-        st.subheader(f"📈 {chart_type}")
-        
+    with instrumentation.section("main_chart:build"):
         if chart_type == "線グラフ":
             fig = px.line(df, x="日付", y=categories, title="時系列データ")
         elif chart_type == "棒グラフ":
@@ -126,22 +122,60 @@ if categories:
             fig = px.imshow(corr_matrix, text_auto=True, title="相関ヒートマップ")
         else:
             fig = px.line(df, x="日付", y=categories, title="デフォルト線グラフ")
-        
-        fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
     
-    with col_table:
-        st.subheader("📋 データテーブル")
-        st.dataframe(df.tail(10), use_container_width=True)
+    fig.update_layout(height=500)
+    instrumentation.plotly_chart(fig, "main_chart", use_container_width=True)
+
+@instrumentation.fragment("trend")
+def trend_section(n_points, categories, start_date, end_date):
+    """トレンド分析（移動平均期間の変更はこのグラフだけを再実行する）"""
+    selected_category = st.selectbox("分析対象", categories)
+    if selected_category:
+        # 移動平均
+        window_size = st.slider("移動平均期間", 5, 50, 10)
+        df = generate_sample_data(n_points, categories, start_date, end_date)
+        # DataFrame に列を足すとセッションごとにデータのコピーが残るため、Series のまま描画する
+        moving_average = df[selected_category].rolling(window=window_size).mean()
         
-        # 統計サマリー
-        st.subheader("📊 統計サマリー")
-        st.write(df[categories].describe())
-    
-    # インタラクティブ分析
-    st.markdown("---")
-    st.subheader("🔍 インタラクティブ分析")
-    
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=df["日付"], y=df[selected_category], name=selected_category))
+        fig.add_trace(go.Scatter(x=df["日付"], y=moving_average, name=f"移動平均({window_size}日)"))
+        fig.update_layout(title=f"{selected_category}のトレンド分析", height=400)
+        instrumentation.plotly_chart(fig, "trend_chart", use_container_width=True)
+
+@instrumentation.fragment("distribution")
+def distribution_section(n_points, categories, start_date, end_date):
+    """分布分析（ビン指定の変更はこのグラフだけを再実行する）"""
+    selected_category = st.selectbox("分析対象", categories)
+    bin_method = st.radio("ビンの決め方", BIN_METHODS, horizontal=True)
+    n_bins = FIXED_BINS
+    if bin_method == "ビン数を指定":
+        n_bins = st.slider("ビン数", 5, MAX_BINS, FIXED_BINS)
+    if selected_category:
+        # 生データではなく集計済みの件数だけを棒グラフとして送る（ペイロードはビン数に比例）
+        counts, edges = histogram_bins(
+            n_points, categories, start_date, end_date, selected_category, bin_method, n_bins
+        )
+        fig = go.Figure(
+            go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                width=np.diff(edges),
+                customdata=np.column_stack([edges[:-1], edges[1:]]),
+                hovertemplate="%{customdata[0]:,.1f} 〜 %{customdata[1]:,.1f}<br>件数: %{y}<extra></extra>",
+            )
+        )
+        fig.update_layout(
+            title=f"{selected_category}の分布（{len(counts)}ビン）",
+            xaxis_title=selected_category,
+            yaxis_title="count",
+            bargap=0,
+        )
+        instrumentation.plotly_chart(fig, "histogram", use_container_width=True)
+
+@instrumentation.fragment("analysis")
+def analysis_section(n_points, categories, start_date, end_date):
+    """インタラクティブ分析（分析タイプの切り替えはこのセクションだけを再実行する）"""
     analysis_type = st.radio(
         "分析タイプを選択:",
         ["トレンド分析", "分布分析", "相関分析"],
@@ -149,27 +183,14 @@ if categories:
     )
     
     if analysis_type == "トレンド分析":
-        selected_category = st.selectbox("分析対象", categories)
-        if selected_category:
-            # 移動平均
-            window_size = st.slider("移動平均期間", 5, 50, 10)
-            df[f"{selected_category}_MA"] = df[selected_category].rolling(window=window_size).mean()
-            
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=df["日付"], y=df[selected_category], name=selected_category))
-            fig.add_trace(go.Scatter(x=df["日付"], y=df[f"{selected_category}_MA"], name=f"移動平均({window_size}日)"))
-            fig.update_layout(title=f"{selected_category}のトレンド分析", height=400)
-            st.plotly_chart(fig, use_container_width=True)
+        trend_section(n_points, categories, start_date, end_date)
     
     elif analysis_type == "分布分析":
-        selected_category = st.selectbox("分析対象", categories)
-        if selected_category:
-            fig = px.histogram(df, x=selected_category, nbins=30, title=f"{selected_category}の分布")
-            st.plotly_chart(fig, use_container_width=True)
+        distribution_section(n_points, categories, start_date, end_date)
     
     elif analysis_type == "相関分析" and len(categories) >= 2:
         # 相関係数の計算
-        correlation = df[categories].corr()
+        correlation = generate_sample_data(n_points, categories, start_date, end_date)[categories].corr()
         
         # 相関行列を表示
         fig = px.imshow(
@@ -178,7 +199,57 @@ if categories:
             aspect="auto",
             title="変数間の相関係数"
         )
-        st.plotly_chart(fig, use_container_width=True)
+        instrumentation.plotly_chart(fig, "correlation", use_container_width=True)
+
+if categories:
+    df = generate_sample_data(data_points, categories, start_date, end_date)
+    
+    # メトリクス表示
+    with instrumentation.section("metrics"):
+        col1, col2, col3, col4 = st.columns(4)
+    
+        with col1:
+            if "売上" in categories:
+                total_sales = df["売上"].sum()
+                st.metric("💰 総売上", f"¥{total_sales:,.0f}")
+    
+        with col2:
+            if "利益" in categories:
+                total_profit = df["利益"].sum()
+                st.metric("💎 総利益", f"¥{total_profit:,.0f}")
+    
+        with col3:
+            if "顧客数" in categories:
+                avg_customers = df["顧客数"].mean()
+                st.metric("👥 平均顧客数", f"{avg_customers:.0f}人")
+    
+        with col4:
+            if "製品数" in categories:
+                avg_products = df["製品数"].mean()
+                st.metric("📦 平均製品数", f"{avg_products:.0f}個")
+    
+    st.markdown("---")
+    
+    # グラフ表示
+    col_chart, col_table = st.columns([2, 1])
+    
+    with col_chart:
+        main_chart_section(data_points, categories, start_date, end_date)
+    
+    with col_table:
+        st.subheader("📋 データテーブル")
+        with instrumentation.section("table"):
+            st.dataframe(df.tail(10), use_container_width=True)
+        
+        # 統計サマリー
+        st.subheader("📊 統計サマリー")
+        with instrumentation.section("describe"):
+            st.write(df[categories].describe())
+    
+    # インタラクティブ分析
+    st.markdown("---")
+    st.subheader("🔍 インタラクティブ分析")
+    analysis_section(data_points, categories, start_date, end_date)
 
 else:
     st.warning("⚠️ 少なくとも一つのカテゴリーを選択してください。")
@@ -193,3 +264,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+instrumentation.end_rerun()
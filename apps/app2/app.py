@@ -11,6 +11,17 @@ from sklearn.metrics import accuracy_score, mean_squared_error, classification_r
 from sklearn.datasets import make_classification, make_regression
 import seaborn as sns
 import matplotlib.pyplot as plt
+import sys
+from pathlib import Path
+
+# 共通モジュール（apps/common）を参照できるようにする
+APPS_DIR = str(Path(__file__).resolve().parent.parent)
+if APPS_DIR not in sys.path:
+    sys.path.insert(0, APPS_DIR)
+
+from common import bounded_cache, instrumentation, session_budget
+
+from importance import DEFAULT_REPEATS, PermutationImportanceJob, model_fingerprint
 
 # ページ設定
 st.set_page_config(
@@ -19,6 +30,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+instrumentation.configure("app2")
+session_budget.track("app2")
 
 # カスタムCSS
 st.markdown("""
@@ -96,12 +109,15 @@ with st.sidebar:
     if algorithm == "Random Forest":
         n_estimators = st.slider("推定器数", 10, 200, 100)
         max_depth = st.slider("最大深度", 1, 20, 10)
+    n_repeats = st.slider("Permutation回数", 1, 20, DEFAULT_REPEATS)
     
     # 実行ボタン
     run_model = st.button("🚀 モデル実行", type="primary")
+    
+    session_budget.render_report()
 
 # データ生成関数
-@st.cache_data
+@bounded_cache.cache_data("generate_data")
 def generate_data(task_type, n_samples, n_features, **kwargs):
     if task_type == "分類 (Classification)":
         X, y = make_classification(
@@ -109,7 +125,7 @@ def generate_data(task_type, n_samples, n_features, **kwargs):
             n_features=n_features,
             n_classes=kwargs.get('n_classes', 3),
             n_informative=min(n_features, kwargs.get('n_classes', 3)),
-            noise=kwargs.get('noise', 0.1),
+            flip_y=kwargs.get('noise', 0.1),  # ラベルノイズ（ランダムに反転させるサンプルの割合）
             random_state=42
         )
     else:  # 回帰
@@ -122,6 +138,7 @@ def generate_data(task_type, n_samples, n_features, **kwargs):
     return X, y
 
 # モデル訓練関数
+@instrumentation.timed()
 def train_model(X_train, y_train, algorithm, **params):
     if algorithm == "Random Forest":
         if len(np.unique(y_train)) <= 10:  # 分類
@@ -146,6 +163,30 @@ def train_model(X_train, y_train, algorithm, **params):
     model.fit(X_train, y_train)
     return model
 
+# Permutation Importance（モデルのフィンガープリントごとに計算ジョブを共有）
+@instrumentation.track_cache("permutation_importance", st.cache_resource(max_entries=32))
+def permutation_importance_job(fingerprint, _model, _X_test, _y_test, n_repeats):
+    return PermutationImportanceJob(_model, _X_test, _y_test, n_repeats)
+
+def importance_figure(results, n_features):
+    """完了した特徴量の重要度（平均 ± 標準偏差）を横棒グラフにする"""
+    importance_df = pd.DataFrame(
+        [(f'特徴量{j+1}', mean, std) for j, (mean, std) in results.items()],
+        columns=['特徴量', '重要度', '標準偏差']
+    ).sort_values('重要度', ascending=True)
+    fig = go.Figure(go.Bar(
+        x=importance_df['重要度'],
+        y=importance_df['特徴量'],
+        error_x=dict(type='data', array=importance_df['標準偏差']),
+        orientation='h'
+    ))
+    fig.update_layout(
+        title=f'Permutation Importance（{len(results)}/{n_features} 特徴量）',
+        xaxis_title='スコア低下量',
+        height=max(300, 28 * n_features)
+    )
+    return fig
+
 # メインコンテンツ
 if run_model:
     with st.spinner('データ生成とモデル訓練中...🔄'):
@@ -156,7 +197,8 @@ if run_model:
             X, y = generate_data(task_type, n_samples, n_features)
         
         # データ分割
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        with instrumentation.section("train_test_split"):
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
         # モデル訓練
         if algorithm == "Random Forest":
@@ -165,7 +207,8 @@ if run_model:
             model = train_model(X_train, y_train, algorithm)
         
         # 予測
-        y_pred = model.predict(X_test)
+        with instrumentation.section("predict"):
+            y_pred = model.predict(X_test)
         
         # 結果表示
         col1, col2 = st.columns([1, 1])
@@ -216,7 +259,7 @@ if run_model:
                     title="真のラベル",
                     labels={'x': '特徴量1', 'y': '特徴量2', 'color': 'クラス'}
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                instrumentation.plotly_chart(fig, "true_label_scatter", use_container_width=True)
                 
                 # 予測結果
                 fig2 = px.scatter(
@@ -226,7 +269,7 @@ if run_model:
                     title="予測ラベル",
                     labels={'x': '特徴量1', 'y': '特徴量2', 'color': 'クラス'}
                 )
-                st.plotly_chart(fig2, use_container_width=True)
+                instrumentation.plotly_chart(fig2, "pred_label_scatter", use_container_width=True)
             
             else:  # 回帰
                 # 予測 vs 実際のプロット
@@ -246,7 +289,7 @@ if run_model:
                     name='理想線',
                     line=dict(color='red', dash='dash')
                 ))
-                st.plotly_chart(fig, use_container_width=True)
+                instrumentation.plotly_chart(fig, "pred_vs_actual", use_container_width=True)
         
         # 特徴量重要度（Random Forestの場合）
         if algorithm == "Random Forest" and hasattr(model, 'feature_importances_'):
@@ -264,7 +307,17 @@ if run_model:
                 orientation='h',
                 title='特徴量重要度ランキング'
             )
-            st.plotly_chart(fig, use_container_width=True)
+            instrumentation.plotly_chart(fig, "feature_importance", use_container_width=True)
+        
+        # Permutation Importance（全アルゴリズム共通）。計算はプロセスプールで行い、
+        # 残りの画面を先に描画してからスクリプト末尾でこの枠を順次埋める
+        st.markdown('<p class="section-header">🔀 Permutation Importance</p>', unsafe_allow_html=True)
+        st.caption("テストデータの特徴量を1つずつシャッフルしたときのスコア低下量（分類: 精度, 回帰: R²）")
+        importance_progress = st.empty()
+        importance_slot = st.empty()
+        with instrumentation.section("permutation_importance:fingerprint"):
+            fingerprint = model_fingerprint(model, X_test, y_test, n_repeats)
+        importance_job = permutation_importance_job(fingerprint, model, X_test, y_test, n_repeats)
         
         # インタラクティブ予測
         st.markdown('<p class="section-header">🎮 インタラクティブ予測</p>', unsafe_allow_html=True)
@@ -285,7 +338,8 @@ if run_model:
         
         if st.button("🔮 予測実行"):
             input_array = np.array(input_values).reshape(1, -1)
-            prediction = model.predict(input_array)[0]
+            with instrumentation.section("interactive_predict"):
+                prediction = model.predict(input_array)[0]
             
             if task_type == "分類 (Classification)":
                 if hasattr(model, 'predict_proba'):
@@ -307,7 +361,7 @@ if run_model:
                         '確率': proba
                     })
                     fig = px.bar(prob_df, x='クラス', y='確率', title='各クラスの予測確率')
-                    st.plotly_chart(fig, use_container_width=True)
+                    instrumentation.plotly_chart(fig, "class_proba", use_container_width=True)
                 else:
                     st.markdown(
                         f"""
@@ -403,3 +457,16 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# Permutation Importance を完了した特徴量から順に表示
+if run_model:
+    with instrumentation.section("permutation_importance:wait"):
+        for results in importance_job.iter_completed():
+            importance_progress.progress(len(results) / n_features, text=f"計算中... {len(results)}/{n_features} 特徴量")
+            with importance_slot.container():
+                instrumentation.plotly_chart(
+                    importance_figure(results, n_features), "permutation_importance", use_container_width=True
+                )
+        importance_progress.empty()
+
+instrumentation.end_rerun()
@@ -0,0 +1,151 @@
+"""モデルに依存しない Permutation Importance
+
+テストデータの特徴量を1列ずつシャッフルしたときのスコア低下量（model.score: 分類は精度、回帰は R²）を
+重要度とする。特徴量ごとの計算はプロセスプールに分散し、終わったものから順に結果を取り出せる。
+"""
+import atexit
+import concurrent.futures
+import hashlib
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+DEFAULT_REPEATS = 5
+
+# プールのワーカー数（0 ならプールを使わずこのプロセスで順に計算する）
+MAX_WORKERS = int(os.environ.get("APP2_IMPORTANCE_WORKERS", min(4, os.cpu_count() or 1)))
+# 次の特徴量の結果をこの秒数待っても届かなければ、そのジョブはプールを諦めて残りをこのプロセスで計算する
+RESULT_TIMEOUT = float(os.environ.get("APP2_IMPORTANCE_TIMEOUT", "60"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Streamlit サーバーはスレッドを持つため fork ではなく spawn でワーカーを作る
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _reset_pool(pool):
+    """ワーカーが異常終了して使えなくなった（BrokenProcessPool）プールを止めて捨てる（次のジョブで作り直す）
+
+    プールは全セッション・全ジョブで共有しているため、壊れていないプールには使わないこと
+    （実行中の他のセッションのタスクまで止まり、それぞれのスクリプトスレッドでの再計算になる）。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # 壊れたプールに残ったワーカーも終了させ、管理スレッドとプロセスを残さない
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def model_fingerprint(model, X, y, n_repeats, seed=42):
+    """学習済みモデル・評価データ・設定から結果のキャッシュキーを作る"""
+    digest = hashlib.sha1()
+    digest.update(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+    for array in (X, y):
+        array = np.ascontiguousarray(array)
+        digest.update(str((array.shape, array.dtype.str)).encode())
+        digest.update(array.tobytes())
+    digest.update(f"{n_repeats}:{seed}".encode())
+    return digest.hexdigest()
+
+
+def permute_feature(model_bytes, X, y, feature, baseline, n_repeats, seed):
+    """1特徴量ぶんの計算（ワーカープロセスで実行される）。(平均低下量, 標準偏差) を返す"""
+    model = pickle.loads(model_bytes)
+    rng = np.random.default_rng([seed, feature])
+    X_perm = X.copy()
+    drops = np.empty(n_repeats)
+    for r in range(n_repeats):
+        X_perm[:, feature] = X[rng.permutation(X.shape[0]), feature]
+        drops[r] = baseline - model.score(X_perm, y)
+    return float(drops.mean()), float(drops.std())
+
+
+class PermutationImportanceJob:
+    """特徴量ごとの計算を投入し、終わった順に結果を返すジョブ"""
+
+    def __init__(self, model, X, y, n_repeats=DEFAULT_REPEATS, seed=42):
+        self.n_features = X.shape[1]
+        self.baseline = model.score(X, y)
+        self.results = {}
+        self._lock = threading.Lock()
+        self._args = (pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL), X, y)
+        self._options = (self.baseline, n_repeats, seed)
+        self.futures = {}
+        self._pool = None
+        if MAX_WORKERS > 0:
+            pool = self._pool = _get_pool()
+            self.futures = {
+                pool.submit(permute_feature, *self._args, j, *self._options): j
+                for j in range(self.n_features)
+            }
+        else:
+            for j in range(self.n_features):
+                self.results[j] = permute_feature(*self._args, j, *self._options)
+
+    @property
+    def done(self):
+        return len(self.results) == self.n_features
+
+    def _compute_locally(self, feature):
+        return permute_feature(*self._args, feature, *self._options)
+
+    def _record(self, feature, value):
+        with self._lock:
+            self.results[feature] = value
+            return dict(self.results)
+
+    def iter_completed(self, timeout=RESULT_TIMEOUT):
+        """完了した特徴量が増えるたびに、それまでの結果 {特徴量: (平均, 標準偏差)} を返す
+
+        timeout 秒待っても次の結果が届かなければ、残りの特徴量はこのプロセスで計算する。
+        """
+        with self._lock:
+            remaining = {f for f, j in self.futures.items() if j not in self.results}
+        if len(remaining) < self.n_features:
+            yield dict(self.results)
+        while remaining:
+            done, remaining = concurrent.futures.wait(
+                remaining, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            if not done:
+                # ワーカーが応答しない: このジョブの未着手分だけ取り消し、残りをこのプロセスで計算する。
+                # プールは他のセッションと共有しているため止めない（応答しないワーカーは戻るまで1枠を占有する）
+                for future in remaining:
+                    future.cancel()
+                for future in remaining:
+                    feature = self.futures[future]
+                    yield self._record(feature, self._compute_locally(feature))
+                return
+            for future in done:
+                feature = self.futures[future]
+                try:
+                    value = future.result()
+                except BrokenProcessPool:
+                    # ワーカーが起動できない・落ちた場合はプールを捨て、このプロセスで計算する
+                    if self._pool is not None:
+                        _reset_pool(self._pool)
+                        self._pool = None
+                    value = self._compute_locally(feature)
+                except concurrent.futures.CancelledError:
+                    # 他のジョブが壊れたプールを止めたときに取り消された
+                    value = self._compute_locally(feature)
+                yield self._record(feature, value)
@@ -0,0 +1,172 @@
+"""宣言的アラートルールとベクトル化評価エンジン
+
+ルールはテーブル（メトリクス・比較演算子・閾値・継続時間・ヒステリシス・重要度）として定義し、
+履歴バッファに追加された新しいサンプルだけを NumPy でまとめて評価する。
+ルール数が数百あっても、1ティック分のサンプルが数千あっても、評価はルール×時刻の配列演算の1パスで済む。
+"""
+import time
+from dataclasses import dataclass, asdict
+
+import numpy as np
+import pandas as pd
+
+# 比較演算子 -> (符号, 厳密比較か)
+# 符号を掛けることで「<」系を「>」系の比較に揃え、全ルールを同じ式で評価する
+COMPARATORS = {
+    ">": (1.0, True),
+    ">=": (1.0, False),
+    "<": (-1.0, True),
+    "<=": (-1.0, False),
+}
+
+SEVERITIES = ("warning", "critical")
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    """アラートルール1行分
+
+    duration: 条件が継続して成立している必要がある秒数（0なら即時発火）
+    hysteresis: 解除に必要な閾値からの戻り幅（発火後は threshold ∓ hysteresis を跨ぐまで継続）
+    message: str.format 形式のメッセージ。{value} に最新値が入る
+    """
+    metric: str
+    comparator: str
+    threshold: float
+    duration: float = 0.0
+    hysteresis: float = 0.0
+    severity: str = "warning"
+    message: str = "{metric}: {value:.2f}"
+
+    def __post_init__(self):
+        if self.comparator not in COMPARATORS:
+            raise ValueError(f"未対応の比較演算子です: {self.comparator}")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"未対応の重要度です: {self.severity}")
+        if self.duration < 0 or self.hysteresis < 0:
+            raise ValueError("duration と hysteresis は0以上で指定してください")
+
+
+def build_default_rules(cpu_threshold=80, memory_threshold=85, network_threshold=500):
+    """app3 のデフォルトアラートルールテーブル"""
+    return [
+        AlertRule("cpu_usage", ">", cpu_threshold, hysteresis=5,
+                  message="⚠️ CPU使用率が高いです: {value:.1f}%"),
+        AlertRule("cpu_usage", ">", 95, duration=5, hysteresis=5, severity="critical",
+                  message="🔴 CPU使用率が危険域です: {value:.1f}%"),
+        AlertRule("memory_usage", ">", memory_threshold, hysteresis=3,
+                  message="⚠️ メモリ使用率が高いです: {value:.1f}%"),
+        AlertRule("network_in", ">", network_threshold, duration=3, hysteresis=50,
+                  message="⚠️ 受信通信量が多いです: {value:.0f}Mbps"),
+        AlertRule("response_time", ">", 500, hysteresis=50,
+                  message="⚠️ 応答時間が遅いです: {value:.0f}ms"),
+        AlertRule("error_rate", ">", 1.0, hysteresis=0.2, severity="critical",
+                  message="🔴 エラー率が高いです: {value:.2f}%"),
+    ]
+
+
+def rules_to_frame(rules):
+    """ルールテーブルを表示用の DataFrame に変換"""
+    return pd.DataFrame([asdict(rule) for rule in rules])
+
+
+def _to_epoch_seconds(timestamps):
+    """datetime 系の列を epoch 秒の float 配列に変換"""
+    values = np.asarray(timestamps, dtype="datetime64[ns]")
+    return values.astype(np.int64) / 1e9
+
+
+class AlertEngine:
+    """ルールテーブルを配列にコンパイルし、状態をインクリメンタルに更新するエンジン"""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.metrics = sorted({rule.metric for rule in self.rules})
+        metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+
+        n_rules = len(self.rules)
+        self._metric_idx = np.array([metric_index[r.metric] for r in self.rules], dtype=np.intp)
+        self._sign = np.array([COMPARATORS[r.comparator][0] for r in self.rules])
+        self._strict = np.array([COMPARATORS[r.comparator][1] for r in self.rules])
+        # 符号を掛けた閾値（発火）と解除閾値
+        self._fire = self._sign * np.array([r.threshold for r in self.rules], dtype=float)
+        self._clear = self._fire - np.array([r.hysteresis for r in self.rules], dtype=float)
+        self._duration = np.array([r.duration for r in self.rules], dtype=float)
+
+        # インクリメンタルな状態
+        self.active = np.zeros(n_rules, dtype=bool)
+        self.breach_since = np.full(n_rules, np.nan)
+        self.last_values = np.full(n_rules, np.nan)
+        self.fired_at = np.full(n_rules, np.nan)
+        self.last_timestamp = -np.inf
+        self.samples_evaluated = 0
+        self.last_eval_ms = 0.0
+
+    def _compare(self, signed_values, signed_threshold):
+        strict = self._strict[:, None]
+        return np.where(
+            strict,
+            signed_values > signed_threshold[:, None],
+            signed_values >= signed_threshold[:, None],
+        )
+
+    def update(self, history):
+        """履歴 DataFrame のうち未評価のサンプルだけを評価して状態を更新する"""
+        start = time.perf_counter()
+
+        if len(history) and self.rules:
+            ts = _to_epoch_seconds(history["timestamp"])
+            new_rows = np.flatnonzero(ts > self.last_timestamp)
+            if new_rows.size:
+                # (メトリクス数, 新サンプル数) -> (ルール数, 新サンプル数)
+                values = history[self.metrics].iloc[new_rows].to_numpy(dtype=float).T
+                signed = self._sign[:, None] * values[self._metric_idx]
+                breach = self._compare(signed, self._fire)
+                holding = self._compare(signed, self._clear)
+                self._advance(ts[new_rows], breach, holding)
+                self.last_values = values[self._metric_idx, -1]
+                self.last_timestamp = ts[new_rows[-1]]
+                self.samples_evaluated += int(new_rows.size)
+
+        self.last_eval_ms = (time.perf_counter() - start) * 1000
+        return self.active
+
+    def _advance(self, ts, breach, holding):
+        """新サンプルを時系列順に状態機械へ流した後の状態を、ルール×時刻の配列演算でまとめて求める
+
+        breach（発火条件）は holding（解除閾値の内側）を含むため、発火中のルールは
+        「最後に holding が途切れた時刻より後に、継続時間を満たした breach がある」場合に限られる。
+        """
+        n = ts.shape[0]
+        steps = np.arange(n)
+
+        # breach が連続している区間の開始時刻（前のバッチから続く区間は breach_since を引き継ぐ）
+        prev = np.concatenate([~np.isnan(self.breach_since)[:, None], breach[:, :-1]], axis=1)
+        run_start = np.maximum.accumulate(np.where(breach & ~prev, steps, -1), axis=1)
+        since = np.where(run_start >= 0, ts[np.maximum(run_start, 0)], self.breach_since[:, None])
+        since = np.where(breach, since, np.nan)
+        with np.errstate(invalid="ignore"):
+            ready = breach & (ts - since >= self._duration[:, None])
+
+        # 最後に解除閾値を跨いだステップ（-1 ならバッチ中ずっと維持）
+        last_release = np.where(~holding, steps, -1).max(axis=1)
+        candidates = ready & (steps > last_release[:, None])
+        refired = candidates.any(axis=1)
+        kept = self.active & (last_release < 0)
+        # 維持されたルールは元の発火時刻、それ以外は解除後に最初に条件を満たした時刻で発火する
+        fired_at = np.where(kept, self.fired_at, ts[candidates.argmax(axis=1)])
+
+        self.active = kept | refired
+        self.breach_since = since[:, -1]
+        self.fired_at = np.where(self.active, fired_at, np.nan)
+
+    def active_alerts(self):
+        """発火中のアラートを (ルール, 最新値) のリストで返す（critical を先頭に）"""
+        indices = np.flatnonzero(self.active)
+        alerts = [(self.rules[i], float(self.last_values[i])) for i in indices]
+        alerts.sort(key=lambda item: SEVERITIES.index(item[0].severity), reverse=True)
+        return alerts
+
+    def active_metrics(self):
+        """発火中のルールを持つメトリクス名の集合"""
+        return {self.rules[i].metric for i in np.flatnonzero(self.active)}
@@ -0,0 +1,158 @@
+"""ストリーミング異常検知
+
+メトリクスごとの状態を配列で保持し、1サンプルあたり O(1) で更新するオンライン検知器。
+- EwmaDetector: 指数加重移動平均/分散による z-score
+- SeasonalDetector: 周期内の位相（時間帯）ごとに EWMA ベースラインを持つ季節性モデル
+どちらもメトリクス方向・時間方向（1ティック分のバッチ）にベクトル化されており、履歴全体を再計算することはない。
+"""
+import numpy as np
+import pandas as pd
+
+METRICS = [
+    'cpu_usage', 'memory_usage', 'network_in', 'network_out',
+    'disk_usage', 'response_time', 'active_users', 'error_rate',
+]
+
+# 分散ゼロ（一定値が続いた直後）での除算を避けるための下限
+_EPS = 1e-12
+
+
+# これ以下のサンプル数では pandas を介さず直接漸化式を回す（ライブ更新の1サンプルなど）
+_SMALL_BATCH = 16
+
+
+def _ewma(initial, values, alpha):
+    """y_0 = initial, y_i = (1 - α) y_{i-1} + α values_i を列ごとに計算し、(k + 1, 列数) で返す"""
+    if values.shape[0] <= _SMALL_BATCH:
+        out = np.empty((values.shape[0] + 1, values.shape[1]))
+        out[0] = initial
+        for i in range(values.shape[0]):
+            out[i + 1] = out[i] + alpha * (values[i] - out[i])
+        return out
+    stacked = pd.DataFrame(np.vstack([initial, values]))
+    return stacked.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+class EwmaDetector:
+    """EWMA 平均・分散による z-score 異常検知"""
+
+    def __init__(self, metrics=METRICS, alpha=0.1, z_threshold=3.0, warmup=10):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha は (0, 1] の範囲で指定してください")
+        self.metrics = list(metrics)
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.last_timestamp = -np.inf
+        self._init_state(1)
+
+    def _init_state(self, n_phases):
+        # 全メトリクスは同時に更新されるため、サンプル数は位相ごとに1つで足りる
+        self.mean = np.zeros((n_phases, len(self.metrics)))
+        self.var = np.zeros((n_phases, len(self.metrics)))
+        self.count = np.zeros(n_phases, dtype=np.int64)
+
+    def _phases(self, timestamps):
+        return np.zeros(timestamps.shape, dtype=np.intp)
+
+    def update(self, timestamps, values):
+        """時系列順のサンプル (n, メトリクス数) を流し込み、(z-score, 異常フラグ) を返す
+
+        z-score は更新前のベースラインに対して計算する（そのサンプル自身で基準を汚さない）。
+        時間方向の漸化式も位相ごとに一括で計算するため、サンプル数ぶんの Python ループはない。
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=float))
+        z = np.zeros_like(values)
+
+        phases = self._phases(timestamps)
+        for p in np.unique(phases):
+            rows = np.flatnonzero(phases == p)
+            z[rows] = self._update_phase(p, values[rows])
+
+        if timestamps.size:
+            self.last_timestamp = timestamps[-1]
+        return z, np.abs(z) > self.z_threshold
+
+    def _update_phase(self, p, x):
+        """1つの位相に属するサンプル列 (k, メトリクス数) で状態を進め、z-score を返す"""
+        z = np.zeros_like(x)
+        count = int(self.count[p])
+        self.count[p] = count + x.shape[0]
+        start = 0
+        if count == 0:
+            # 初回サンプルで平均を初期化する
+            self.mean[p] = x[0]
+            start, count = 1, 1
+        rest = x[start:]
+        if not rest.shape[0]:
+            return z
+
+        alpha = self.alpha
+        # mean_i = (1 - α) mean_{i-1} + α x_i
+        means = _ewma(self.mean[p], rest, alpha)
+        diff = rest - means[:-1]
+        # var_i = (1 - α) (var_{i-1} + α diff_i²) = (1 - α) var_{i-1} + α ((1 - α) diff_i²)
+        variances = _ewma(self.var[p], (1 - alpha) * diff * diff, alpha)
+
+        ready = count + np.arange(rest.shape[0]) >= self.warmup
+        z[start:] = np.where(ready[:, None], diff / np.sqrt(variances[:-1] + _EPS), 0.0)
+        self.mean[p] = means[-1]
+        self.var[p] = variances[-1]
+        return z
+
+    def observe(self, sample):
+        """generate_realtime_data() の1サンプルを評価し、{metric}_z / {metric}_anomaly を付与する"""
+        self.observe_many([sample])
+        return sample
+
+    def observe_many(self, samples):
+        """時系列順の複数サンプル（リプレイの1ティック分など）をまとめて評価し、フラグを付与する"""
+        # キャッシュ済みの同一サンプルなど、学習済みの時刻以前のものは二重に学習しない
+        timestamps = np.array([sample['timestamp'].timestamp() for sample in samples], dtype=float)
+        fresh = np.flatnonzero(timestamps > self.last_timestamp)
+        if not fresh.size:
+            return samples
+        values = [[samples[i][metric] for metric in self.metrics] for i in fresh]
+        z, flags = self.update(timestamps[fresh], values)
+        z, flags = z.tolist(), flags.tolist()
+        for row, i in enumerate(fresh):
+            sample = samples[i]
+            for j, metric in enumerate(self.metrics):
+                sample[f'{metric}_z'] = z[row][j]
+                sample[f'{metric}_anomaly'] = flags[row][j]
+        return samples
+
+    def anomalies(self, sample):
+        """サンプル中で異常フラグが立っているメトリクスと z-score"""
+        return [
+            (metric, sample.get(f'{metric}_z', 0.0))
+            for metric in self.metrics
+            if sample.get(f'{metric}_anomaly', False)
+        ]
+
+
+class SeasonalDetector(EwmaDetector):
+    """周期（season 秒）を n_bins 個の位相に分け、位相ごとの EWMA ベースラインと比較する"""
+
+    def __init__(self, metrics=METRICS, season=86400, n_bins=24, alpha=0.2,
+                 z_threshold=3.0, warmup=3):
+        if season <= 0 or n_bins <= 0:
+            raise ValueError("season と n_bins は正の値で指定してください")
+        self.season = float(season)
+        self.n_bins = int(n_bins)
+        super().__init__(metrics, alpha=alpha, z_threshold=z_threshold, warmup=warmup)
+        self._init_state(self.n_bins)
+
+    def _phases(self, timestamps):
+        return ((timestamps % self.season) / self.season * self.n_bins).astype(np.intp)
+
+
+def build_detector(method, z_threshold=3.0):
+    """サイドバーの選択から検知器を生成（"なし" の場合は None）"""
+    if method == "EWMA z-score":
+        return EwmaDetector(z_threshold=z_threshold)
+    if method == "季節性ベースライン":
+        # デモ用に5分周期・30秒刻みの位相で学習する（本番では1日周期など）
+        return SeasonalDetector(season=300, n_bins=10, z_threshold=z_threshold)
+    return None
@@ -7,6 +7,21 @@ from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
 import time
 import random
+import os
+import sys
+from pathlib import Path
+
+# 共通モジュール（apps/common）を参照できるようにする
+APPS_DIR = str(Path(__file__).resolve().parent.parent)
+if APPS_DIR not in sys.path:
+    sys.path.insert(0, APPS_DIR)
+
+from common import bounded_cache, instrumentation, session_budget
+
+from alerts import AlertEngine, build_default_rules, rules_to_frame
+from anomaly import build_detector
+from fleet import FleetCollector, build_samplers, host_names
+from replay import DEFAULT_TRACE, SPEEDS, ReplaySource, generate_trace, load_trace
 
 # ページ設定
 st.set_page_config(
@@ -15,6 +30,8 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+instrumentation.configure("app3")
+session_budget.track("app3")
 
 # カスタムCSS
 st.markdown("""
@@ -63,6 +80,18 @@ st.markdown("""
 # ヘッダー
 st.markdown('<div class="main-title">📈 リアルタイム監視ダッシュボード</div>', unsafe_allow_html=True)
 
+# メトリクスの表示名
+metric_labels = {
+    'cpu_usage': 'CPU使用率',
+    'memory_usage': 'メモリ使用率',
+    'network_in': '受信通信量',
+    'network_out': '送信通信量',
+    'disk_usage': 'ディスク使用率',
+    'response_time': '応答時間',
+    'active_users': 'アクティブユーザー数',
+    'error_rate': 'エラー率',
+}
+
 # サイドバー設定
 with st.sidebar:
     st.header("⚙️ ダッシュボード設定")
@@ -90,6 +119,19 @@ with st.sidebar:
     memory_threshold = st.slider("メモリ警告閾値 (%)", 0, 100, 85)
     network_threshold = st.slider("ネットワーク警告閾値 (Mbps)", 0, 1000, 500)
     
+    # アラートルールテーブル（スライダーの閾値を反映）
+    alert_rules = build_default_rules(cpu_threshold, memory_threshold, network_threshold)
+    with st.expander("📋 アラートルール"):
+        st.dataframe(rules_to_frame(alert_rules), use_container_width=True, hide_index=True)
+    
+    # 異常検知設定
+    st.subheader("🔍 異常検知")
+    anomaly_method = st.selectbox(
+        "検知方式",
+        ["EWMA z-score", "季節性ベースライン", "なし"]
+    )
+    z_threshold = st.slider("z-score閾値", 2.0, 6.0, 3.0, 0.5)
+    
     # 表示期間
     st.subheader("📅 表示期間")
     time_window = st.selectbox(
@@ -97,9 +139,46 @@ with st.sidebar:
         ["1分", "5分", "10分", "30分", "1時間"],
         index=2
     )
+    
+    # トレースリプレイ（記録済み・生成したトレースを高速再生）
+    st.subheader("📼 トレースリプレイ")
+    replay_enabled = st.checkbox("トレースを再生", value=False)
+    if replay_enabled:
+        replay_kind = st.radio(
+            "トレース",
+            ["シードから生成", "ファイル"],
+            index=1 if DEFAULT_TRACE else 0,
+            horizontal=True
+        )
+        replay_path, replay_seed = "", None
+        if replay_kind == "ファイル":
+            replay_path = st.text_input("トレースファイル (.jsonl / .npz)", DEFAULT_TRACE)
+        else:
+            replay_seed = int(st.number_input("シード", 0, 2**31 - 1, 42))
+        replay_speed = st.select_slider("再生速度", SPEEDS, value=100, format_func=lambda x: f"{x}×")
+        replay_loop = st.checkbox("ループ再生", value=True)
+    
+    # フリート監視（複数ホスト）
+    st.subheader("🖥️ フリート監視")
+    fleet_enabled = st.checkbox("複数ホストを表示", value=False)
+    if fleet_enabled:
+        fleet_hosts = st.slider("ホスト数", 10, 500, 100, 10)
+        fleet_metric = st.selectbox(
+            "フリート指標",
+            list(metric_labels),
+            format_func=lambda m: metric_labels[m]
+        )
+        top_k = st.slider("上位ホスト数 (K)", 3, 20, 10)
+        drill_host = st.selectbox(
+            "ドリルダウン対象",
+            [None] + host_names(fleet_hosts),
+            format_func=lambda h: "自動（最も負荷の高いホスト）" if h is None else h
+        )
+    
+    session_budget.render_report()
 
 # データ生成関数
-@st.cache_data(ttl=1)  # 1秒間キャッシュ
+@bounded_cache.cache_data("generate_realtime_data", ttl=1)  # 1秒間キャッシュ
 def generate_realtime_data():
     """リアルタイムデータを生成"""
     current_time = datetime.now()
@@ -141,9 +220,190 @@ def generate_realtime_data():
         'error_rate': error_rate
     }
 
+# フリートのコレクター（ホスト数ごとにプロセス内で共有し、全セッションが同じバッファを読む）
+@instrumentation.track_cache("fleet_collector", st.cache_resource(max_entries=4))
+def get_fleet_collector(n_hosts):
+    """n_hosts 台分のサンプラーとリングバッファ"""
+    return FleetCollector(build_samplers(n_hosts))
+
+# リプレイ用トレース（読み取り専用なのでコピーせずセッション間で共有）
+@instrumentation.track_cache("replay_trace", st.cache_resource(max_entries=4))
+def load_replay_trace(path, seed):
+    """ファイルを読み込むか、シードから6時間分のトレースを生成する"""
+    if path:
+        return load_trace(path)
+    return generate_trace(seed, seconds=6 * 3600)
+
 # 履歴データ管理
 if 'history_data' not in st.session_state:
     st.session_state.history_data = []
+# メモリ予算を超えたら古いサンプルから間引き、アイドル時は直近分だけ残す
+session_budget.register_compactor('history_data', session_budget.thin_history)
+
+# リプレイの開始・停止（サンプルの時刻系列が変わるため、履歴・アラート・異常検知の状態も作り直す）
+replay_config = (replay_path, replay_seed, replay_speed, replay_loop) if replay_enabled else None
+if st.session_state.get('replay_config') != replay_config:
+    st.session_state.replay_config = replay_config
+    st.session_state.replay = None
+    st.session_state.history_data = []
+    st.session_state.alert_engine = None
+    st.session_state.anomaly_config = None
+    if replay_config is not None:
+        try:
+            trace = load_replay_trace(replay_path, replay_seed)
+        except (OSError, ValueError) as exc:
+            st.error(f"トレースを読み込めませんでした: {exc}")
+        else:
+            st.session_state.replay = ReplaySource(trace, replay_speed, loop=replay_loop)
+replay = st.session_state.get('replay')
+
+# アラートエンジン（ルールが変わったら作り直し、履歴から状態を再構築）
+if st.session_state.get('alert_engine') is None or st.session_state.alert_engine.rules != tuple(alert_rules):
+    st.session_state.alert_engine = AlertEngine(alert_rules)
+alert_engine = st.session_state.alert_engine
+
+# 異常検知器（設定が変わったら作り直し、保持中の履歴で学習し直す）
+anomaly_config = (anomaly_method, z_threshold)
+if st.session_state.get('anomaly_config') != anomaly_config:
+    st.session_state.anomaly_config = anomaly_config
+    st.session_state.anomaly_detector = build_detector(anomaly_method, z_threshold)
+    if st.session_state.anomaly_detector is not None:
+        for sample in st.session_state.history_data:
+            st.session_state.anomaly_detector.observe(sample)
+anomaly_detector = st.session_state.anomaly_detector
+
+def add_anomaly_markers(fig, df, metric, **trace_kwargs):
+    """異常フラグが立ったサンプルをマーカーで重ねる"""
+    flag_column = f'{metric}_anomaly'
+    if flag_column not in df:
+        return
+    anomalous = df[df[flag_column].fillna(False).astype(bool)]
+    if anomalous.empty:
+        return
+    fig.add_trace(
+        go.Scatter(
+            x=anomalous['timestamp'],
+            y=anomalous[metric],
+            mode='markers',
+            name=f'{metric_labels[metric]} 異常',
+            marker=dict(color='#d63031', size=11, symbol='x'),
+            **trace_kwargs
+        )
+    )
+
+def render_fleet_view(collector, metric, k, drill_host, window_seconds):
+    """フリート全体の集計・上位 K ホスト・1ホストのドリルダウン（ブラウザへは集計済みの値だけを送る）"""
+    window_seconds = min(window_seconds, collector.capacity)
+    latest = collector.latest_stats()
+    
+    st.markdown("## 🖥️ フリート監視")
+    st.caption(f"{collector.n_hosts}ホスト / {len(collector.samplers)}サンプラー / 直近{window_seconds}秒")
+    
+    # フリート集計（平均・p95・最大）
+    columns = st.columns(4)
+    for column, key, unit in zip(
+        columns,
+        ['cpu_usage', 'memory_usage', 'response_time', 'error_rate'],
+        ['%', '%', 'ms', '%'],
+    ):
+        with column:
+            stats = latest[key]
+            st.markdown(
+                f"""
+                <div class="metric-container">
+                    <h4>{metric_labels[key]}</h4>
+                    <h2>{stats['mean']:.1f}{unit}</h2>
+                    <small>p95 {stats['p95']:.1f}{unit} / 最大 {stats['max']:.1f}{unit}</small>
+                </div>
+                """,
+                unsafe_allow_html=True
+            )
+    
+    timestamps, series = collector.fleet_series(metric, window_seconds)
+    fig_fleet = go.Figure()
+    for name, label, dash in [('mean', '平均', 'solid'), ('p95', 'p95', 'dash'), ('max', '最大', 'dot')]:
+        fig_fleet.add_trace(
+            go.Scatter(x=timestamps, y=series[name], mode='lines', name=label, line=dict(dash=dash))
+        )
+    fig_fleet.update_layout(
+        title=f"フリート全体の{metric_labels[metric]}",
+        xaxis_title="時刻",
+        height=350
+    )
+    instrumentation.plotly_chart(fig_fleet, "fleet_chart", use_container_width=True)
+    
+    # 上位 K ホスト（直近30秒の平均）
+    top, scores = collector.top_hosts(metric, k)
+    names = [collector.hosts[i] for i in top]
+    col_top, col_heatmap = st.columns([1, 2])
+    
+    with col_top:
+        fig_top = go.Figure(
+            go.Bar(x=scores, y=names, orientation='h', marker_color='#ff6b6b')
+        )
+        fig_top.update_layout(
+            title=f"上位{len(names)}ホスト（直近30秒平均）",
+            yaxis=dict(autorange='reversed'),
+            height=400
+        )
+        instrumentation.plotly_chart(fig_top, "fleet_top_k", use_container_width=True)
+    
+    with col_heatmap:
+        heat_timestamps, matrix = collector.host_matrix(top, metric, window_seconds)
+        fig_heatmap = go.Figure(
+            go.Heatmap(x=heat_timestamps, y=names, z=matrix, colorscale='YlOrRd')
+        )
+        fig_heatmap.update_layout(
+            title=f"上位ホストの{metric_labels[metric]}",
+            yaxis=dict(autorange='reversed'),
+            height=400
+        )
+        instrumentation.plotly_chart(fig_heatmap, "fleet_heatmap", use_container_width=True)
+    
+    # ドリルダウン（未指定なら最も負荷の高いホスト）
+    if drill_host is None:
+        if not len(top):
+            return
+        host = int(top[0])
+    else:
+        host = collector.hosts.index(drill_host)
+    host_timestamps, host_series = collector.host_series(host, window_seconds)
+    st.subheader(f"🔎 {collector.hosts[host]} のドリルダウン")
+    fig_host = go.Figure()
+    fig_host.add_trace(
+        go.Scatter(x=host_timestamps, y=host_series[metric], mode='lines', name=collector.hosts[host],
+                   line=dict(color='#d63031', width=2))
+    )
+    for name, label in [('mean', 'フリート平均'), ('p95', 'フリート p95')]:
+        fig_host.add_trace(
+            go.Scatter(x=timestamps, y=series[name], mode='lines', name=label,
+                       line=dict(dash='dot', width=1))
+        )
+    fig_host.update_layout(title=f"{metric_labels[metric]}（フリートとの比較）", height=350)
+    instrumentation.plotly_chart(fig_host, "fleet_drilldown", use_container_width=True)
+    
+    st.dataframe(
+        pd.DataFrame({
+            '項目': [metric_labels[m] for m in collector.metrics],
+            collector.hosts[host]: [host_series[m][-1] for m in collector.metrics],
+            'フリート平均': [latest[m]['mean'] for m in collector.metrics],
+            'フリート p95': [latest[m]['p95'] for m in collector.metrics],
+        }).round(2),
+        use_container_width=True,
+        hide_index=True
+    )
+
+def ingest_samples(samples, cutoff):
+    """サンプルを異常検知に通して履歴へ追加し、表示期間より古いものを捨てる（ライブ・リプレイ共通）"""
+    if anomaly_detector is not None and samples:
+        with instrumentation.section("anomaly_detection"):
+            anomaly_detector.observe_many(samples)
+    history = st.session_state.history_data
+    history.extend(samples)
+    st.session_state.history_data = [
+        data for data in history
+        if data['timestamp'] > cutoff
+    ]
 
 # 時間窓の設定
 time_windows = {
@@ -159,23 +419,45 @@ if auto_refresh:
     # プレースホルダーを作成
     placeholder = st.empty()
     
+    # ベンチマーク・テスト用にティック数を制限できるようにする（0 は無制限）
+    max_ticks = int(os.environ.get("APP3_MAX_TICKS", "0"))
+    tick_count = 0
+    
     while True:
-        new_data = generate_realtime_data()
-        st.session_state.history_data.append(new_data)
+        tick_start = time.perf_counter()
+        if replay is not None:
+            # 前回のティックから届いた分をまとめて取り込む（時刻はトレース上の時刻）
+            dropped_before = replay.dropped
+            with instrumentation.section("replay_poll"):
+                new_samples = replay.poll()
+            current_time = replay.now()
+            instrumentation.count("replay", "ingested", len(new_samples))
+            instrumentation.count("replay", "dropped", replay.dropped - dropped_before)
+        else:
+            new_samples = [generate_realtime_data()]
+            current_time = datetime.now()
         
         # 指定された時間窓内のデータのみ保持
-        current_time = datetime.now()
         cutoff_time = current_time - timedelta(seconds=time_windows[time_window])
-        st.session_state.history_data = [
-            data for data in st.session_state.history_data
-            if data['timestamp'] > cutoff_time
-        ]
+        ingest_samples(new_samples, cutoff_time)
+        
+        if fleet_enabled:
+            fleet_collector = get_fleet_collector(fleet_hosts)
+            with instrumentation.section("fleet_poll"):
+                fleet_collector.poll()
         
         with placeholder.container():
             # 最新データを表示
             if st.session_state.history_data:
                 latest_data = st.session_state.history_data[-1]
                 
+                # データを DataFrame に変換し、新しいサンプルだけアラート評価
+                with instrumentation.section("dataframe"):
+                    df = pd.DataFrame(st.session_state.history_data)
+                with instrumentation.section("alert_eval"):
+                    alert_engine.update(df)
+                alerting_metrics = alert_engine.active_metrics()
+                
                 # ステータス概要
                 st.markdown("## 🔴 システム状況")
                 
@@ -183,7 +465,7 @@ if auto_refresh:
                 
                 with col1:
                     # CPU使用率
-                    cpu_color = "🔴" if latest_data['cpu_usage'] > cpu_threshold else "🟢"
+                    cpu_color = "🔴" if 'cpu_usage' in alerting_metrics else "🟢"
                     st.markdown(
                         f"""
                         <div class="metric-container">
@@ -196,7 +478,7 @@ if auto_refresh:
                 
                 with col2:
                     # メモリ使用率
-                    memory_color = "🔴" if latest_data['memory_usage'] > memory_threshold else "🟢"
+                    memory_color = "🔴" if 'memory_usage' in alerting_metrics else "🟢"
                     st.markdown(
                         f"""
                         <div class="metric-container">
@@ -209,7 +491,7 @@ if auto_refresh:
                 
                 with col3:
                     # 応答時間
-                    response_color = "🔴" if latest_data['response_time'] > 500 else "🟢"
+                    response_color = "🔴" if 'response_time' in alerting_metrics else "🟢"
                     st.markdown(
                         f"""
                         <div class="metric-container">
@@ -222,7 +504,7 @@ if auto_refresh:
                 
                 with col4:
                     # エラー率
-                    error_color = "🔴" if latest_data['error_rate'] > 1.0 else "🟢"
+                    error_color = "🔴" if 'error_rate' in alerting_metrics else "🟢"
                     st.markdown(
                         f"""
                         <div class="metric-container">
@@ -234,29 +516,43 @@ if auto_refresh:
                     )
                 
                 # アラート表示
-                alerts = []
-                if latest_data['cpu_usage'] > cpu_threshold:
-                    alerts.append(f"⚠️ CPU使用率が高いです: {latest_data['cpu_usage']:.1f}%")
-                if latest_data['memory_usage'] > memory_threshold:
-                    alerts.append(f"⚠️ メモリ使用率が高いです: {latest_data['memory_usage']:.1f}%")
-                if latest_data['response_time'] > 500:
-                    alerts.append(f"⚠️ 応答時間が遅いです: {latest_data['response_time']:.0f}ms")
-                if latest_data['error_rate'] > 1.0:
-                    alerts.append(f"🔴 エラー率が高いです: {latest_data['error_rate']:.2f}%")
+                alerts = alert_engine.active_alerts()
                 
-                if alerts:
+                anomalies = anomaly_detector.anomalies(latest_data) if anomaly_detector else []
+                
+                if alerts or anomalies:
                     st.markdown("## 🚨 アラート")
-                    for alert in alerts:
+                    for rule, value in alerts:
+                        card_class = "critical-card" if rule.severity == "critical" else "alert-card"
+                        st.markdown(
+                            f'<div class="{card_class}">{rule.message.format(value=value, metric=rule.metric)}</div>',
+                            unsafe_allow_html=True
+                        )
+                    for metric, z_score in anomalies:
                         st.markdown(
-                            f'<div class="alert-card">{alert}</div>',
+                            f'<div class="alert-card">📈 異常値を検知: {metric_labels[metric]} '
+                            f'{latest_data[metric]:.1f} (z={z_score:+.1f}, {anomaly_method})</div>',
                             unsafe_allow_html=True
                         )
+                st.caption(
+                    f"アラート評価: {len(alert_engine.rules)}ルール / "
+                    f"{alert_engine.last_eval_ms:.2f}ms"
+                )
+                if replay is not None:
+                    replay_stats = replay.stats()
+                    st.caption(
+                        f"📼 リプレイ {replay_stats['speed']:g}× / "
+                        f"取り込み {replay_stats['throughput']:,.0f}サンプル/秒 "
+                        f"（累計 {replay_stats['ingested']:,}） / "
+                        f"ティック p50 {replay_stats['tick_p50_ms']:.0f}ms・"
+                        f"p95 {replay_stats['tick_p95_ms']:.0f}ms / "
+                        f"破棄 {replay_stats['dropped']:,} / 周回 {replay_stats['laps']}"
+                    )
+                    if replay.finished:
+                        st.info("トレースの再生が終わりました。")
                 
                 # データがある場合のみグラフを表示
                 if len(st.session_state.history_data) > 1:
-                    # データを DataFrame に変換
-                    df = pd.DataFrame(st.session_state.history_data)
-                    
                     # グラフ表示
                     st.markdown("## 📊 リアルタイムグラフ")
                     
@@ -301,13 +597,21 @@ if auto_refresh:
                                 )
                             )
                         
+                        for metric, monitored in [
+                            ('cpu_usage', monitor_cpu),
+                            ('memory_usage', monitor_memory),
+                            ('disk_usage', monitor_disk),
+                        ]:
+                            if monitored:
+                                add_anomaly_markers(fig, df, metric)
+                        
                         fig.update_layout(
                             yaxis_title="使用率 (%)",
                             xaxis_title="時刻",
                             height=400,
                             showlegend=True
                         )
-                        st.plotly_chart(fig, use_container_width=True)
+                        instrumentation.plotly_chart(fig, "resource_chart", use_container_width=True)
                     
                     # ネットワーク監視
                     if monitor_network:
@@ -336,12 +640,15 @@ if auto_refresh:
                             )
                         )
                         
+                        add_anomaly_markers(fig_network, df, 'network_in')
+                        add_anomaly_markers(fig_network, df, 'network_out')
+                        
                         fig_network.update_layout(
                             yaxis_title="通信量 (Mbps)",
                             xaxis_title="時刻",
                             height=400
                         )
-                        st.plotly_chart(fig_network, use_container_width=True)
+                        instrumentation.plotly_chart(fig_network, "network_chart", use_container_width=True)
                     
                     # アプリケーション監視
                     st.subheader("🚀 アプリケーション性能")
@@ -356,7 +663,8 @@ if auto_refresh:
                             labels={'response_time': '応答時間 (ms)', 'timestamp': '時刻'}
                         )
                         fig_response.update_traces(line_color='#fd79a8', line_width=3)
-                        st.plotly_chart(fig_response, use_container_width=True)
+                        add_anomaly_markers(fig_response, df, 'response_time', showlegend=False)
+                        instrumentation.plotly_chart(fig_response, "response_chart", use_container_width=True)
                     
                     with col_users:
                         # アクティブユーザー数
@@ -366,7 +674,8 @@ if auto_refresh:
                             labels={'active_users': 'ユーザー数', 'timestamp': '時刻'}
                         )
                         fig_users.update_traces(fill='tonexty', fillcolor='rgba(116, 185, 255, 0.4)')
-                        st.plotly_chart(fig_users, use_container_width=True)
+                        add_anomaly_markers(fig_users, df, 'active_users', showlegend=False)
+                        instrumentation.plotly_chart(fig_users, "users_chart", use_container_width=True)
                     
                     # エラー率
                     st.subheader("❌ エラー監視")
@@ -376,7 +685,8 @@ if auto_refresh:
                         labels={'error_rate': 'エラー率 (%)', 'timestamp': '時刻'}
                     )
                     fig_error.update_traces(marker_color='#e84393')
-                    st.plotly_chart(fig_error, use_container_width=True)
+                    add_anomaly_markers(fig_error, df.tail(20), 'error_rate', showlegend=False)
+                    instrumentation.plotly_chart(fig_error, "error_chart", use_container_width=True)
                     
                     # 統計サマリー
                     st.markdown("## 📋 統計サマリー")
@@ -409,6 +719,13 @@ if auto_refresh:
                         })
                         st.dataframe(max_stats, use_container_width=True)
                 
+                if fleet_enabled:
+                    with instrumentation.section("fleet_view"):
+                        render_fleet_view(
+                            fleet_collector, fleet_metric, top_k, drill_host,
+                            time_windows[time_window]
+                        )
+                
                 # 最終更新時刻
                 st.markdown(
                     f"""
@@ -419,6 +736,17 @@ if auto_refresh:
                     unsafe_allow_html=True
                 )
         
+        tick_seconds = time.perf_counter() - tick_start
+        instrumentation.observe_duration("tick", tick_seconds)
+        if replay is not None:
+            replay.record_tick(tick_seconds)
+        instrumentation.flush()
+        session_budget.track("app3", active=False)
+        
+        tick_count += 1
+        if max_ticks and tick_count >= max_ticks:
+            break
+        
         # 指定された間隔で更新
         time.sleep(refresh_rate)
 
@@ -426,6 +754,8 @@ else:
     # 自動更新がOFFの場合
     if st.button("🔄 手動更新", type="primary"):
         new_data = generate_realtime_data()
+        if anomaly_detector is not None:
+            anomaly_detector.observe(new_data)
         st.session_state.history_data.append(new_data)
         st.success("データを更新しました！")
     
@@ -441,3 +771,5 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+instrumentation.end_rerun()
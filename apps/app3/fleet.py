@@ -0,0 +1,197 @@
+"""複数ホスト（ECS タスク）のフリート監視
+
+サンプル値は ホスト × メトリクス × 時刻 の列指向リングバッファ（float32 の3次元配列）に保持し、
+1ティック分のホスト全体をまとめて書き込む。フリート全体の集計（平均・p95・最大）は書き込み時に
+時刻方向の新しい行だけを NumPy でまとめて計算して別のリングバッファへ積むため、表示時は切り出すだけで済む。
+上位 K ホストの抽出やホスト単位のドリルダウンもホスト方向にベクトル化されており、
+ホストごとの Python ループは持たない。
+"""
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from anomaly import METRICS
+
+# 保持する秒数（1秒刻み）。500ホスト × 8メトリクス × 600秒 × float32 ≒ 9.6MB
+CAPACITY_SECONDS = int(os.environ.get("APP3_FLEET_SECONDS", "600"))
+# 初回ポーリング時に埋めておく秒数
+BACKFILL_SECONDS = 60
+# 1サンプラー（エージェント）が受け持つホスト数
+HOSTS_PER_SAMPLER = 50
+
+STATS = ("mean", "p95", "max")
+
+_SECOND = np.timedelta64(1, "s")
+
+# メトリクスごとの (ベースの下限, 上限, 揺らぎ, スパイク幅, 値の上限)
+_PROFILES = {
+    'cpu_usage': (20, 60, 4.0, 35.0, 100.0),
+    'memory_usage': (35, 70, 2.0, 10.0, 100.0),
+    'network_in': (20, 200, 25.0, 300.0, None),
+    'network_out': (10, 150, 20.0, 250.0, None),
+    'disk_usage': (40, 75, 0.3, 0.0, 100.0),
+    'response_time': (60, 180, 15.0, 500.0, None),
+    'active_users': (20, 120, 6.0, 80.0, None),
+    'error_rate': (0.0, 0.3, 0.05, 2.5, 100.0),
+}
+
+
+class SyntheticSampler:
+    """ホスト群のメトリクスを生成するローカルの代替サンプラー（実環境ではエージェント1つに相当）
+
+    ホストごとのベースライン・AR(1) の揺らぎ・まれなスパイクを持ち、1ステップで受け持ち全ホストを生成する。
+    """
+
+    def __init__(self, hosts, seed=0, metrics=METRICS, phi=0.8, spike_rate=0.01):
+        self.hosts = list(hosts)
+        self.metrics = list(metrics)
+        self.phi = phi
+        self.spike_rate = spike_rate
+        self._rng = np.random.default_rng(seed)
+        profile = np.array([_PROFILES[m][:4] for m in self.metrics], dtype=float)
+        low, high = profile[:, 0], profile[:, 1]
+        self._base = self._rng.uniform(low, high, size=(len(self.hosts), len(self.metrics)))
+        self._noise = profile[:, 2]
+        self._spike = profile[:, 3]
+        self._upper = np.array(
+            [_PROFILES[m][4] if _PROFILES[m][4] is not None else np.inf for m in self.metrics]
+        )
+        self._state = np.zeros_like(self._base)
+
+    def sample(self, n_steps=1):
+        """(ステップ数, ホスト数, メトリクス数) の配列を返す"""
+        shape = self._base.shape
+        out = np.empty((n_steps,) + shape, dtype=np.float32)
+        for t in range(n_steps):
+            # ループは時刻方向だけ（各ステップはホスト × メトリクス方向にベクトル化）
+            self._state = self.phi * self._state + self._rng.normal(0.0, self._noise, size=shape)
+            spikes = self._rng.random(shape) < self.spike_rate
+            values = self._base + self._state + spikes * self._rng.uniform(0.5, 1.0, size=shape) * self._spike
+            out[t] = np.clip(values, 0.0, self._upper)
+        return out
+
+
+def host_names(n_hosts):
+    return [f"task-{i:03d}" for i in range(n_hosts)]
+
+
+def build_samplers(n_hosts, seed=42, hosts_per_sampler=HOSTS_PER_SAMPLER):
+    """n_hosts 台を HOSTS_PER_SAMPLER 台ずつ受け持つサンプラー群"""
+    hosts = host_names(n_hosts)
+    return [
+        SyntheticSampler(hosts[start:start + hosts_per_sampler], seed=seed + start)
+        for start in range(0, n_hosts, hosts_per_sampler)
+    ]
+
+
+class FleetCollector:
+    """サンプラー群から1秒刻みでサンプルを集め、ホスト × メトリクス × 時刻のリングバッファに保持する
+
+    プロセス内で共有し（st.cache_resource）、各セッションは poll() で最新まで進めてから読み出す。
+    前回のポーリングから空いた秒数ぶんはまとめて生成するため、どのセッションの更新間隔でも1秒刻みになる。
+    """
+
+    def __init__(self, samplers, capacity=CAPACITY_SECONDS, metrics=METRICS):
+        self.samplers = list(samplers)
+        self.hosts = [host for sampler in self.samplers for host in sampler.hosts]
+        self.metrics = list(metrics)
+        self.capacity = int(capacity)
+        self.values = np.zeros((self.capacity, len(self.hosts), len(self.metrics)), dtype=np.float32)
+        self.timestamps = np.zeros(self.capacity, dtype="datetime64[ms]")
+        # (時刻, 統計量, メトリクス)
+        self.stats = np.zeros((self.capacity, len(STATS), len(self.metrics)), dtype=np.float32)
+        self.size = 0
+        self._head = 0
+        self._last = None
+        self._lock = threading.Lock()
+
+    @property
+    def n_hosts(self):
+        return len(self.hosts)
+
+    def metric_index(self, metric):
+        return self.metrics.index(metric)
+
+    def poll(self, now=None):
+        """現在時刻まで進め、追加したサンプル数を返す"""
+        now = np.datetime64(now or datetime.now(), "ms")
+        with self._lock:
+            if self._last is None:
+                self._last = now - BACKFILL_SECONDS * _SECOND
+            n_steps = int((now - self._last) // _SECOND)
+            if n_steps <= 0:
+                return 0
+            n_steps = min(n_steps, self.capacity)
+            timestamps = now - np.arange(n_steps - 1, -1, -1) * _SECOND
+            values = np.concatenate([s.sample(n_steps) for s in self.samplers], axis=1)
+            self._append(timestamps, values)
+            self._last = timestamps[-1]
+            return n_steps
+
+    def _append(self, timestamps, values):
+        n = len(timestamps)
+        # 新しい行だけ集計する（ホスト方向の縮約）
+        stats = np.stack([
+            values.mean(axis=1),
+            np.percentile(values, 95, axis=1),
+            values.max(axis=1),
+        ], axis=1)
+        rows = (self._head + np.arange(n)) % self.capacity
+        self.values[rows] = values
+        self.timestamps[rows] = timestamps
+        self.stats[rows] = stats
+        self._head = (self._head + n) % self.capacity
+        self.size = min(self.capacity, self.size + n)
+
+    def _window_rows(self, seconds):
+        n = min(self.size, int(seconds))
+        return (self._head - n + np.arange(n)) % self.capacity
+
+    def fleet_series(self, metric, seconds):
+        """(時刻, {統計量: 系列}) — フリート集計の時系列"""
+        with self._lock:
+            rows = self._window_rows(seconds)
+            series = self.stats[rows, :, self.metric_index(metric)]
+            return self.timestamps[rows], {name: series[:, i] for i, name in enumerate(STATS)}
+
+    def latest_stats(self):
+        """{メトリクス: {統計量: 最新値}}"""
+        with self._lock:
+            if not self.size:
+                return {}
+            latest = self.stats[(self._head - 1) % self.capacity]
+        return {
+            metric: {name: float(latest[i, j]) for i, name in enumerate(STATS)}
+            for j, metric in enumerate(self.metrics)
+        }
+
+    def top_hosts(self, metric, k, seconds=30):
+        """直近 seconds 秒の平均が高い上位 k ホストの (インデックス, 平均値)（降順）"""
+        with self._lock:
+            rows = self._window_rows(seconds)
+            if not rows.size:
+                return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+            score = self.values[rows, :, self.metric_index(metric)].mean(axis=0)
+        k = min(k, score.size)
+        if k <= 0:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top])]
+        return top, score[top]
+
+    def host_matrix(self, hosts, metric, seconds):
+        """(時刻, (ホスト数, 時刻数) の行列) — 指定ホスト群の1メトリクス"""
+        with self._lock:
+            rows = self._window_rows(seconds)
+            hosts = np.asarray(hosts, dtype=np.intp)
+            matrix = self.values[rows[:, None], hosts[None, :], self.metric_index(metric)]
+            return self.timestamps[rows], matrix.T
+
+    def host_series(self, host, seconds):
+        """(時刻, {メトリクス: 系列}) — 1ホストのドリルダウン"""
+        with self._lock:
+            rows = self._window_rows(seconds)
+            values = self.values[rows, host, :]
+            return self.timestamps[rows], {m: values[:, j] for j, m in enumerate(self.metrics)}
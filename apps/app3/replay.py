@@ -0,0 +1,240 @@
+"""メトリクストレースのリプレイ
+
+記録済みのトレース（JSONL / NumPy .npz）またはシードから決定的に生成したトレースを、
+実時間の 10〜1000 倍の速度で再生する。generate_realtime_data() の代わりに1ティックあたり
+複数のサンプルを返し、app3 は同じ取り込み経路（異常検知 → 履歴 → アラート評価 → グラフ）で処理する。
+
+再生位置は壁時計から決まるため、処理が遅れたティックの次は多くのサンプルがまとめて届く。
+1ティックで取り込む数は max_batch までとし、超えた分は古いものから捨てて件数を数える。
+
+トレースの作成:
+    python apps/app3/replay.py generate --seed 42 --seconds 86400 trace.npz
+    python apps/app3/replay.py generate --seed 42 --seconds 3600 --interval 0.1 trace.jsonl
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from anomaly import METRICS
+
+SPEEDS = (10, 30, 100, 300, 1000)
+# 1ティックで取り込むサンプル数の上限（超えた分は捨てる）
+MAX_BATCH = int(os.environ.get("APP3_REPLAY_MAX_BATCH", "5000"))
+# 既定のトレース（空なら シードから生成）
+DEFAULT_TRACE = os.environ.get("APP3_REPLAY_TRACE", "")
+
+
+@dataclass
+class Trace:
+    """timestamps: epoch 秒（昇順）、values: (サンプル数, メトリクス数)"""
+    timestamps: np.ndarray
+    values: np.ndarray
+    metrics: list
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def interval(self):
+        if len(self) < 2:
+            return 1.0
+        return float(np.median(np.diff(self.timestamps)))
+
+    @property
+    def duration(self):
+        """ループ再生の1周の長さ（末尾のサンプルの後に1間隔ぶん空ける）"""
+        return float(self.timestamps[-1] - self.timestamps[0]) + self.interval
+
+
+def generate_trace(seed=42, seconds=3600, interval=1.0, start=1_700_000_000.0):
+    """シードから決定的にトレースを生成する（日周変動・AR(1) の揺らぎ・スパイク・障害区間を含む）"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds / interval)
+    t = start + np.arange(n) * interval
+    daily = np.sin(2 * np.pi * (t % 86400) / 86400)
+
+    # AR(1) の揺らぎ（時間方向の再帰は指数平滑の畳み込みで近似する）
+    kernel = 0.9 ** np.arange(min(n, 64))
+    noise = rng.normal(0, 1, size=(n, len(METRICS)))
+    noise = np.apply_along_axis(lambda col: np.convolve(col, kernel)[:n], 0, noise) * np.sqrt(1 - 0.81)
+
+    base = np.array([45, 55, 100, 70, 60, 120, 300, 0.2])
+    amplitude = np.array([15, 8, 60, 40, 2, 40, 150, 0.1])
+    scale = np.array([5, 3, 30, 25, 1, 20, 30, 0.1])
+    values = base + amplitude * daily[:, None] + scale * noise
+
+    spikes = rng.random((n, len(METRICS))) < 0.005
+    values += spikes * rng.uniform(1, 3, size=(n, len(METRICS))) * amplitude * 2
+
+    # 障害区間（CPU・応答時間・エラー率がまとめて悪化する）
+    for _ in range(max(1, int(seconds // 3600))):
+        begin = rng.integers(0, n)
+        end = min(n, begin + int(rng.integers(30, 300) / interval))
+        for metric, extra in (('cpu_usage', 35), ('response_time', 600), ('error_rate', 2.5)):
+            values[begin:end, METRICS.index(metric)] += extra
+
+    upper = np.array([100, 100, np.inf, np.inf, 100, np.inf, np.inf, 100])
+    values = np.clip(values, 0, upper)
+    values[:, METRICS.index('active_users')] = np.round(values[:, METRICS.index('active_users')])
+    return Trace(t, values, list(METRICS))
+
+
+def _parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def load_trace(path):
+    """JSONL（1行1サンプル、timestamp は epoch 秒か ISO 8601）または .npz を読み込む"""
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            metrics = [str(m) for m in data["metrics"]]
+            trace = Trace(data["timestamps"].astype(float), data["values"].astype(float), metrics)
+    elif path.suffix in (".jsonl", ".ndjson"):
+        timestamps, rows = [], []
+        with path.open(encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                try:
+                    timestamps.append(_parse_timestamp(record["timestamp"]))
+                    rows.append([float(record[metric]) for metric in METRICS])
+                except (KeyError, TypeError, ValueError) as exc:
+                    raise ValueError(f"{path}:{line_no}: 不正なサンプルです ({exc})") from exc
+        trace = Trace(np.array(timestamps), np.array(rows, dtype=float).reshape(-1, len(METRICS)), list(METRICS))
+    else:
+        raise ValueError(f"未対応のトレース形式です: {path.suffix}（.jsonl / .npz）")
+
+    missing = [metric for metric in METRICS if metric not in trace.metrics]
+    if missing:
+        raise ValueError(f"トレースにメトリクスがありません: {', '.join(missing)}")
+    if not len(trace):
+        raise ValueError("トレースが空です")
+    order = np.argsort(trace.timestamps, kind="stable")
+    columns = [trace.metrics.index(metric) for metric in METRICS]
+    return Trace(trace.timestamps[order], trace.values[order][:, columns], list(METRICS))
+
+
+def save_trace(trace, path):
+    path = Path(path)
+    if path.suffix == ".npz":
+        np.savez_compressed(path, timestamps=trace.timestamps, values=trace.values, metrics=np.array(trace.metrics))
+    elif path.suffix in (".jsonl", ".ndjson"):
+        with path.open("w", encoding="utf-8") as f:
+            for t, row in zip(trace.timestamps.tolist(), trace.values.tolist()):
+                f.write(json.dumps({"timestamp": t, **dict(zip(trace.metrics, row))}) + "\n")
+    else:
+        raise ValueError(f"未対応のトレース形式です: {path.suffix}（.jsonl / .npz）")
+
+
+class ReplaySource:
+    """トレースを speed 倍速で再生し、ティックごとに届いたサンプルを返す
+
+    トレースの先頭は再生開始時の現在時刻に対応づけ、サンプルの timestamp はトレース上の間隔のまま進める
+    （100倍速なら壁時計1秒で100秒分進む）。表示期間の判定には now() を使う。
+    """
+
+    def __init__(self, trace, speed, loop=True, max_batch=MAX_BATCH, clock=time.monotonic):
+        self.trace = trace
+        self.speed = float(speed)
+        self.loop = loop
+        self.max_batch = max_batch
+        self._clock = clock
+        self._offsets = trace.timestamps - trace.timestamps[0]
+        self._origin = datetime.now().timestamp()
+        self._started = clock()
+        self.cursor = 0
+        self.ingested = 0
+        self.dropped = 0
+        self.ticks = 0
+        self.tick_latencies = deque(maxlen=120)
+
+    def _position(self):
+        """再生開始からのトレース上の経過秒数"""
+        return (self._clock() - self._started) * self.speed
+
+    def now(self):
+        return datetime.fromtimestamp(self._origin + self._position())
+
+    @property
+    def finished(self):
+        return not self.loop and self.cursor >= len(self.trace)
+
+    def _target_index(self, position):
+        """position までに届いているサンプル数（ループ再生では周回ぶんを通算する）"""
+        n = len(self.trace)
+        if not self.loop:
+            return int(np.searchsorted(self._offsets, position, side="right"))
+        lap, within = divmod(position, self.trace.duration)
+        return int(lap) * n + int(np.searchsorted(self._offsets, within, side="right"))
+
+    def poll(self):
+        """前回から届いたサンプルを generate_realtime_data() と同じ形式の辞書のリストで返す"""
+        target = self._target_index(self._position())
+        pending = target - self.cursor
+        if pending > self.max_batch:
+            # 取り込みが追いつかない分は古いものから捨てる
+            self.dropped += pending - self.max_batch
+            self.cursor = target - self.max_batch
+        indices = np.arange(self.cursor, target)
+        self.cursor = target
+        self.ingested += indices.size
+        if not indices.size:
+            return []
+
+        n = len(self.trace)
+        rows = indices % n
+        epochs = self._origin + (indices // n) * self.trace.duration + self._offsets[rows]
+        values = self.trace.values[rows].tolist()
+        return [
+            {'timestamp': datetime.fromtimestamp(t), **dict(zip(self.trace.metrics, row))}
+            for t, row in zip(epochs.tolist(), values)
+        ]
+
+    def record_tick(self, seconds):
+        self.ticks += 1
+        self.tick_latencies.append(seconds)
+
+    def stats(self):
+        """取り込みスループット・ティック遅延・破棄数などの集計"""
+        elapsed = max(self._clock() - self._started, 1e-9)
+        latencies = np.array(self.tick_latencies) * 1000
+        return {
+            "speed": self.speed,
+            "ingested": self.ingested,
+            "dropped": self.dropped,
+            "throughput": self.ingested / elapsed,
+            "ticks": self.ticks,
+            "tick_p50_ms": float(np.percentile(latencies, 50)) if latencies.size else 0.0,
+            "tick_p95_ms": float(np.percentile(latencies, 95)) if latencies.size else 0.0,
+            "laps": self.cursor // len(self.trace),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app3 リプレイ用トレースの生成")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="シードから決定的にトレースを生成して保存する")
+    gen.add_argument("output", type=Path, help="出力先（.jsonl / .npz）")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--seconds", type=float, default=3600)
+    gen.add_argument("--interval", type=float, default=1.0, help="サンプル間隔（秒）")
+    args = parser.parse_args()
+
+    trace = generate_trace(args.seed, args.seconds, args.interval)
+    save_trace(trace, args.output)
+    print(f"{args.output}: {len(trace)} samples, {trace.duration:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""3アプリを1つの Streamlit サーバーのページとして配信する統合エントリーポイント
+
+pandas / NumPy / Plotly などのインポート、データキャッシュ（common.bounded_cache）、メトリクスのエクスポーターを
+1プロセスで共有する。各アプリは /app1, /app2, /app3 のページとして従来と同じ URL で開ける。
+
+    streamlit run combined/app.py
+"""
+import sys
+from pathlib import Path
+
+import streamlit as st
+
+APPS_DIR = Path(__file__).resolve().parent.parent
+APPS = {
+    "app1": ("📊 データ可視化ダッシュボード", "📊"),
+    "app2": ("🤖 機械学習デモアプリ", "🤖"),
+    "app3": ("📈 リアルタイム監視ダッシュボード", "📈"),
+}
+
+# 単体起動時はスクリプトのディレクトリが import パスに入るため、統合時も同じ状態にする
+# （app3 は同じディレクトリの alerts / anomaly を import する）
+for path in [APPS_DIR] + [APPS_DIR / app for app in APPS]:
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+def home():
+    """ランディングページ（nginx の / と同じ案内）"""
+    st.title("🚀 ECS Multi Streamlit Apps")
+    st.write("アプリケーションを選択してください:")
+    for column, (app, (title, icon)) in zip(st.columns(len(APPS)), APPS.items()):
+        with column:
+            st.page_link(pages[app], label=title, icon=icon)
+
+
+pages = {
+    app: st.Page(APPS_DIR / app / "app.py", title=title.split(" ", 1)[1], icon=icon, url_path=app)
+    for app, (title, icon) in APPS.items()
+}
+st.navigation([st.Page(home, title="ホーム", icon="🏠", default=True), *pages.values()]).run()
@@ -0,0 +1 @@
+"""app1/app2/app3 で共有するユーティリティ"""
@@ -0,0 +1,308 @@
+"""バイト数で上限を持つ共有データキャッシュ
+
+st.cache_data は max_entries を指定しない限り、引数の組み合わせごとの結果をプロセスが終わるまで保持する。
+スライダーを動かし続けるとデータフレームや配列が溜まり続けるため、データ系のキャッシュはここを通す。
+
+- 値は pickle したバイト列で保持する（保持量が正確に分かり、呼び出し側には st.cache_data と同じくコピーを返す）
+- キャッシュごとの合計バイト数（APP_CACHE_MAX_MB）を超えたら、最近使われておらず再計算が安いものから追い出す
+  （GreedyDual-Size: 優先度 = 基準値 L + 計算秒数 / バイト数。計算コストが同じなら LRU と同じ順になる）
+- APP_CACHE_DIR を指定すると、追い出したエントリーをローカルディスクへ退避し、次のミス時にそこから読み戻す
+  （ディスク側も APP_CACHE_DISK_MAX_MB を超えたら古いファイルから削除）
+- ルックアップ・ミスは instrumentation.track_cache、ディスクヒット・追い出し・退避はイベントとして数え、
+  保持バイト数と件数はゲージとして公開する
+
+使い方:
+    @bounded_cache.cache_data("generate_data")
+    def generate_data(task_type, n_samples, ...):
+        ...
+
+引数名が "_" で始まる引数は st.cache_data と同じくキーに含めない。
+"""
+import collections
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from common import instrumentation
+
+MB = 1024 * 1024
+
+MAX_BYTES = int(float(os.environ.get("APP_CACHE_MAX_MB", "32")) * MB)
+DISK_DIR = os.environ.get("APP_CACHE_DIR", "")
+DISK_MAX_BYTES = int(float(os.environ.get("APP_CACHE_DISK_MAX_MB", "256")) * MB)
+
+
+@dataclass
+class Entry:
+    payload: bytes
+    cost: float
+    created: float
+    priority: float = 0.0
+
+    @property
+    def nbytes(self):
+        return len(self.payload)
+
+
+class BoundedCache:
+    """1関数分のキャッシュ（メモリ層 + 任意のディスク層）"""
+
+    def __init__(self, name, max_bytes=MAX_BYTES, ttl=None, disk_dir=DISK_DIR, disk_max_bytes=DISK_MAX_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = Path(disk_dir) / name if disk_dir else None
+        self.entries = collections.OrderedDict()
+        self.bytes_held = 0
+        # GreedyDual-Size の基準値（最後に追い出したエントリーの優先度）
+        self._inflation = 0.0
+        self.counters = collections.Counter()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._disk_index = {}
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            for path in self.disk_dir.glob("*.pkl"):
+                self._disk_index[path.stem] = path.stat().st_size
+
+    # ------------------------------------------------------------------ キー
+
+    @staticmethod
+    def make_key(func, args, kwargs):
+        """関数のコードと（"_" で始まらない）引数から決まるキー"""
+        # track_cache のラッパー越しに元の関数のシグネチャとコードを使う
+        func = inspect.unwrap(func)
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        hashed = {k: v for k, v in bound.arguments.items() if not k.startswith("_")}
+        digest = hashlib.sha1()
+        digest.update(func.__qualname__.encode())
+        digest.update(func.__code__.co_code)
+        digest.update(repr(func.__code__.co_consts).encode())
+        digest.update(pickle.dumps(hashed, protocol=pickle.HIGHEST_PROTOCOL))
+        return digest.hexdigest()
+
+    # ------------------------------------------------------------------ 取得・格納
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """(見つかったか, 値) を返す。メモリ層になければディスク層を探して読み戻す"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._expired(entry.created):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry.priority = self._inflation + entry.cost / max(1, entry.nbytes)
+                self.counters["hit"] += 1
+                payload = entry.payload
+            else:
+                payload = None
+        if payload is not None:
+            return True, pickle.loads(payload)
+
+        loaded = self._load_disk(key)
+        if loaded is None:
+            return False, None
+        cost, created, payload = loaded
+        with self._lock:
+            self.counters["disk_hit"] += 1
+        instrumentation.count(self.name, "cache_disk_hit")
+        self._store(key, Entry(payload, cost, created))
+        return True, pickle.loads(payload)
+
+    def put(self, key, value, cost):
+        self._store(key, Entry(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), cost, time.time()))
+
+    def _store(self, key, entry):
+        spilled = []
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            if entry.nbytes > self.max_bytes:
+                # 1件で上限を超える値はメモリに置かず、ディスク層があればそちらへ
+                spilled.append((key, entry))
+            else:
+                entry.priority = self._inflation + entry.cost / max(1, entry.nbytes)
+                self.entries[key] = entry
+                self.bytes_held += entry.nbytes
+                while self.bytes_held > self.max_bytes:
+                    victim_key, victim = self._pop_victim()
+                    spilled.append((victim_key, victim))
+                    self.counters["eviction"] += 1
+                    instrumentation.count(self.name, "cache_eviction")
+        for victim_key, victim in spilled:
+            self._spill(victim_key, victim)
+        self.publish()
+
+    def _pop_victim(self):
+        # 優先度が最小のもの（同点なら最も長く使われていないもの）を追い出す
+        victim_key = min(self.entries, key=lambda k: self.entries[k].priority)
+        victim = self.entries[victim_key]
+        self._inflation = victim.priority
+        self._remove(victim_key)
+        return victim_key, victim
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes_held -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.bytes_held = 0
+            self._inflation = 0.0
+            if self.disk_dir is not None:
+                for key in list(self._disk_index):
+                    self._unlink(key)
+        self.publish()
+
+    # ------------------------------------------------------------------ ディスク層
+
+    def _path(self, key):
+        return self.disk_dir / f"{key}.pkl"
+
+    def _spill(self, key, entry):
+        if self.disk_dir is None or self._expired(entry.created) or entry.nbytes > self.disk_max_bytes:
+            return
+        record = pickle.dumps((entry.cost, entry.created, entry.payload), protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(record)
+            os.replace(tmp_path, path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_index[key] = len(record)
+            self.counters["spill"] += 1
+            # 古いファイル（更新時刻順）から削除して上限内に収める
+            while sum(self._disk_index.values()) > self.disk_max_bytes and len(self._disk_index) > 1:
+                oldest = min(
+                    (k for k in self._disk_index if k != key),
+                    key=lambda k: self._mtime(k),
+                )
+                self._unlink(oldest)
+        instrumentation.count(self.name, "cache_spill")
+
+    def _mtime(self, key):
+        try:
+            return self._path(key).stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def _unlink(self, key):
+        self._disk_index.pop(key, None)
+        self._path(key).unlink(missing_ok=True)
+
+    def _load_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        with self._lock:
+            if key not in self._disk_index:
+                return None
+        try:
+            cost, created, payload = pickle.loads(self._path(key).read_bytes())
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            with self._lock:
+                self._unlink(key)
+            return None
+        if self._expired(created):
+            with self._lock:
+                self._unlink(key)
+            return None
+        return cost, created, payload
+
+    # ------------------------------------------------------------------ 集計
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "entries": len(self.entries),
+                "bytes": self.bytes_held,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_index),
+                "disk_bytes": sum(self._disk_index.values()),
+                **{kind: self.counters[kind] for kind in ("hit", "miss", "disk_hit", "eviction", "spill")},
+            }
+
+    def publish(self):
+        stats = self.stats()
+        instrumentation.set_gauge(self.name, "cache_bytes", stats["bytes"])
+        instrumentation.set_gauge(self.name, "cache_entries", stats["entries"])
+        if self.disk_dir is not None:
+            instrumentation.set_gauge(self.name, "cache_disk_bytes", stats["disk_bytes"])
+
+    # ------------------------------------------------------------------ デコレーター
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def decorate(self, func):
+        """instrumentation.track_cache に渡すキャッシュデコレーター（st.cache_data と同じ形）"""
+        def cached(*args, **kwargs):
+            key = self.make_key(func, args, kwargs)
+            found, value = self.get(key)
+            if found:
+                return value
+            # 同じキーを複数セッションが同時に計算しないよう、キーごとに直列化する
+            key_lock = self._key_lock(key)
+            with key_lock:
+                found, value = self.get(key)
+                if found:
+                    return value
+                with self._lock:
+                    self.counters["miss"] += 1
+                start = time.perf_counter()
+                value = func(*args, **kwargs)
+                self.put(key, value, time.perf_counter() - start)
+            with self._lock:
+                self._key_locks.pop(key, None)
+            return value
+
+        cached.clear = self.clear
+        return cached
+
+
+CACHES = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name, **options):
+    """名前ごとにプロセス内で1つのキャッシュを返す（リランのたびに作り直さない）"""
+    with _caches_lock:
+        cache = CACHES.get(name)
+        if cache is None:
+            cache = CACHES[name] = BoundedCache(name, **options)
+        else:
+            # 上限や TTL の変更は既存のエントリーを残したまま反映する
+            cache.max_bytes = options.get("max_bytes", cache.max_bytes)
+            cache.ttl = options.get("ttl", cache.ttl)
+        return cache
+
+
+def cache_data(name, max_bytes=None, ttl=None):
+    """st.cache_data の代わりに使うデコレーター（計測は instrumentation.track_cache と共通）"""
+    options = {"ttl": ttl}
+    if max_bytes is not None:
+        options["max_bytes"] = max_bytes
+    return instrumentation.track_cache(name, get_cache(name, **options).decorate)
+
+
+def stats():
+    """全キャッシュの集計（セッション予算のレポート・ベンチマーク用）"""
+    with _caches_lock:
+        caches = list(CACHES.values())
+    return [cache.stats() for cache in caches]
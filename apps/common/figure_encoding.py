@@ -0,0 +1,89 @@
+"""Plotly フィギュアのデータ配列をコンパクトなバイナリ表現に変換する
+
+plotly.py 6 以降は NumPy の数値配列を JSON リストではなく base64 の型付き配列
+（{"dtype": "f4", "bdata": "..."}）として書き出し、Plotly.js はそれをそのまま TypedArray として読む。
+ただし日時は ISO 文字列のリスト、float64 は8バイトのまま送られるため、ここで
+- 日時 → エポックミリ秒の float64（Plotly.js の date 軸は数値をエポックミリ秒として扱う）
+- float64 → float32（画面表示には十分な精度）
+に変換してから st.plotly_chart に渡す。Plotly.js は int64 の型付き配列を扱えないため、
+日時は int64 ではなく float64（2^53 ミリ秒まで誤差なし）で送る。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# 変換対象のトレース属性（データ配列）
+ARRAY_PROPS = ("x", "y", "z", "customdata", "width", "base")
+# 日時として扱う属性（対応する軸は xaxis / yaxis）
+DATE_PROPS = ("x", "y")
+
+# この要素数未満の配列は変換しても効果がないのでそのまま送る
+MIN_SIZE = 16
+
+
+def enabled():
+    return os.environ.get("APP_COMPACT_FIGURES", "1") != "0"
+
+
+def _as_array(value):
+    if value is None or isinstance(value, (str, bytes)):
+        return None
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.to_numpy()
+    if isinstance(value, (list, tuple)):
+        if len(value) < MIN_SIZE:
+            return None
+        value = np.asarray(value)
+    if not isinstance(value, np.ndarray) or value.size < MIN_SIZE:
+        return None
+    return value
+
+
+def _epoch_ms(values):
+    """日時配列を壁時計の時刻のままエポックミリ秒へ（タイムゾーン付きはタイムゾーンを外す）"""
+    times = pd.DatetimeIndex(pd.to_datetime(values.ravel()))
+    if times.tz is not None:
+        times = times.tz_localize(None)
+    ms = times.to_numpy(dtype="datetime64[ms]").astype(np.int64).astype(np.float64)
+    return ms.reshape(values.shape)
+
+
+def _is_datetime(values):
+    if values.dtype.kind == "M":
+        return True
+    if values.dtype.kind == "O":
+        first = values.flat[0]
+        return isinstance(first, (pd.Timestamp, np.datetime64)) or hasattr(first, "isoformat")
+    return False
+
+
+def compact_figure(fig):
+    """フィギュアのデータ配列をその場で変換し、変換した配列の数を返す"""
+    converted = 0
+    date_axes = set()
+    for trace in fig.data:
+        for prop in ARRAY_PROPS:
+            if prop not in trace:
+                continue
+            values = _as_array(trace[prop])
+            if values is None:
+                continue
+            if prop in DATE_PROPS and _is_datetime(values):
+                if f"{prop}axis" not in trace:
+                    continue
+                # トレースの xaxis="x2" はレイアウトの xaxis2 を指す
+                axis = f"{prop}axis{(trace[f'{prop}axis'] or prop)[1:]}"
+                if fig.layout[axis].type not in (None, "-", "date"):
+                    continue
+                trace[prop] = _epoch_ms(values)
+                date_axes.add(axis)
+            elif values.dtype == np.float64:
+                trace[prop] = values.astype(np.float32)
+            else:
+                continue
+            converted += 1
+    for axis in date_axes:
+        # 数値のままだと線形軸と判定されるため、日時軸であることを明示する
+        fig.layout[axis].type = "date"
+    return converted
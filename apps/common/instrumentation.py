@@ -0,0 +1,404 @@
+"""リラン単位のホットパス計測とメトリクスエクスポート
+
+各アプリは名前付きセクションの所要時間・キャッシュのヒット/ミス・ペイロードサイズを記録し、
+プロセス全体で集計したヒストグラムを Prometheus テキスト形式 / JSON で公開する。
+
+環境変数:
+    APP_METRICS_ENABLED  "1" で計測を有効化（未設定時は何もしない no-op）
+    APP_METRICS_FILE     集計結果の書き出し先（.json なら JSON、それ以外は Prometheus テキスト）
+                         "{app}" はアプリ名に置換される
+    APP_METRICS_PORT     指定すると /metrics と /metrics.json を返す HTTP サーバーを起動
+
+無効時は section() が共有の no-op コンテキストを返すだけなので、オーバーヘッドは無視できる。
+"""
+import bisect
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ヒストグラムのバケット上限（秒 / バイト）
+DURATION_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1KiB .. 256MiB
+
+# 書き出しファイルの更新間隔（秒）
+FLUSH_INTERVAL = 5.0
+
+_NULL_SECTION = contextlib.nullcontext()
+
+
+def _env_flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+class Histogram:
+    """累積バケット付きヒストグラム（Prometheus の histogram 型と同じ構造）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "buckets": {("+Inf" if b == float("inf") else repr(b)): c for b, c in self.cumulative()},
+        }
+
+
+class Registry:
+    """プロセス内で共有されるメトリクス集計（Streamlit のセッションスレッド間で共有）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.payloads = {}
+        self.counters = {}
+        self.gauges = {}
+
+    def observe_duration(self, app, name, seconds):
+        with self._lock:
+            hist = self.durations.get((app, name))
+            if hist is None:
+                hist = self.durations[(app, name)] = Histogram(DURATION_BUCKETS)
+            hist.observe(seconds)
+
+    def observe_payload(self, app, name, nbytes):
+        with self._lock:
+            hist = self.payloads.get((app, name))
+            if hist is None:
+                hist = self.payloads[(app, name)] = Histogram(BYTES_BUCKETS)
+            hist.observe(nbytes)
+
+    def increment(self, app, name, kind, amount=1):
+        with self._lock:
+            key = (app, name, kind)
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, app, name, kind, value):
+        with self._lock:
+            self.gauges[(app, name, kind)] = value
+
+    def snapshot(self):
+        """JSON 化できる辞書で集計結果を返す"""
+        with self._lock:
+            return {
+                "sections": [
+                    {"app": app, "section": name, **hist.to_dict()}
+                    for (app, name), hist in sorted(self.durations.items())
+                ],
+                "payloads": [
+                    {"app": app, "name": name, **hist.to_dict()}
+                    for (app, name), hist in sorted(self.payloads.items())
+                ],
+                "counters": [
+                    {"app": app, "name": name, "kind": kind, "value": value}
+                    for (app, name, kind), value in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"app": app, "name": name, "kind": kind, "value": value}
+                    for (app, name, kind), value in sorted(self.gauges.items())
+                ],
+            }
+
+    def render_prometheus(self):
+        """Prometheus テキスト形式で集計結果を返す"""
+        lines = []
+        with self._lock:
+            for metric, help_text, series, label in (
+                ("streamlit_section_seconds", "Time spent in a named section of a rerun",
+                 self.durations, "section"),
+                ("streamlit_payload_bytes", "Serialized payload size sent to the browser",
+                 self.payloads, "name"),
+            ):
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (app, name), hist in sorted(series.items()):
+                    labels = f'app="{app}",{label}="{name}"'
+                    for bound, count in hist.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {hist.total}")
+                    lines.append(f"{metric}_count{{{labels}}} {hist.count}")
+
+            lines.append("# HELP streamlit_events_total Cache lookups, misses and other events")
+            lines.append("# TYPE streamlit_events_total counter")
+            for (app, name, kind), value in sorted(self.counters.items()):
+                lines.append(f'streamlit_events_total{{app="{app}",name="{name}",kind="{kind}"}} {value}')
+
+            lines.append("# HELP streamlit_gauge Current value of a process-level quantity (cache bytes held etc.)")
+            lines.append("# TYPE streamlit_gauge gauge")
+            for (app, name, kind), value in sorted(self.gauges.items()):
+                lines.append(f'streamlit_gauge{{app="{app}",name="{name}",kind="{kind}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+_state = {
+    "enabled": _env_flag("APP_METRICS_ENABLED"),
+    "app": "app",
+    "last_flush": 0.0,
+    "server": None,
+}
+_server_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_rerun = threading.local()
+
+
+def enabled():
+    return _state["enabled"]
+
+
+def _current_app():
+    return getattr(_rerun, "app", _state["app"])
+
+
+def configure(app_name, enable=None):
+    """各リランの先頭で呼ぶ。リラン計測を開始し、HTTP エクスポーターは初回のみ起動する"""
+    _state["app"] = app_name
+    _rerun.app = app_name
+    if enable is not None:
+        _state["enabled"] = enable
+    if not _state["enabled"]:
+        return
+    # Streamlit はセッションごとに別スレッドでスクリプトを実行するためスレッドローカルに保持
+    _rerun.start = time.perf_counter()
+    if os.environ.get("APP_METRICS_PORT"):
+        _start_server(int(os.environ["APP_METRICS_PORT"]))
+
+
+def end_rerun():
+    """スクリプト末尾で呼ぶ。リラン全体の所要時間を記録して書き出す"""
+    if not _state["enabled"]:
+        return
+    start = getattr(_rerun, "start", None)
+    if start is not None:
+        REGISTRY.observe_duration(_current_app(), "rerun", time.perf_counter() - start)
+        _rerun.start = None
+    flush()
+
+
+def section(name):
+    """名前付きセクションの所要時間を計測するコンテキストマネージャー"""
+    if not _state["enabled"]:
+        return _NULL_SECTION
+    return _timed_section(name)
+
+
+@contextlib.contextmanager
+def _timed_section(name):
+    app = _current_app()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe_duration(app, name, time.perf_counter() - start)
+
+
+def timed(name=None):
+    """関数全体をセクションとして計測するデコレーター"""
+    def decorator(func):
+        section_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return func(*args, **kwargs)
+            with _timed_section(section_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe_duration(name, seconds):
+    """with ブロックで囲みにくい処理（ループの1ティックなど）の所要時間を記録する"""
+    if _state["enabled"]:
+        REGISTRY.observe_duration(_current_app(), name, seconds)
+
+
+def count(name, kind, amount=1):
+    """任意のイベントを数える"""
+    if _state["enabled"]:
+        REGISTRY.increment(_current_app(), name, kind, amount)
+
+
+def set_gauge(name, kind, value):
+    """現在値を記録する（キャッシュの保持バイト数など）"""
+    if _state["enabled"]:
+        REGISTRY.set_gauge(_current_app(), name, kind, value)
+
+
+def observe_payload(name, nbytes):
+    """ブラウザへ送るペイロードのバイト数を記録する"""
+    if _state["enabled"]:
+        REGISTRY.observe_payload(_current_app(), name, nbytes)
+
+
+def track_cache(name, cache_decorator):
+    """st.cache_data などのキャッシュデコレーターを包み、ルックアップとミスを数える
+
+    キャッシュ本体の中身はミス時にしか実行されないため、
+    ルックアップ数 - ミス数 がヒット数になる。
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def on_miss(*args, **kwargs):
+            count(name, "cache_miss")
+            with section(f"{name}:compute"):
+                return func(*args, **kwargs)
+
+        cached = cache_decorator(on_miss)
+
+        @functools.wraps(func)
+        def lookup(*args, **kwargs):
+            count(name, "cache_lookup")
+            with section(name):
+                return cached(*args, **kwargs)
+
+        lookup.clear = getattr(cached, "clear", None)
+        return lookup
+    return decorator
+
+
+def _is_fragment_rerun():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return bool(ctx is not None and ctx.fragment_ids_this_run)
+
+
+def fragment(name, **fragment_kwargs):
+    """st.fragment の計測付きラッパー
+
+    フラグメント内のウィジェット操作ではページ全体ではなくその関数だけが再実行される。
+    ページ全体のリランの一部として実行された回数（full_rerun）と、フラグメント単体で再実行された
+    回数（fragment_rerun）を分けて数え、所要時間をセクション "fragment:{name}" として記録する。
+    """
+    import streamlit as st
+
+    def decorator(func):
+        # フラグメント単体の再実行は configure() を通らないため、宣言したリランのアプリ名を保持する
+        app = _current_app()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return func(*args, **kwargs)
+            _rerun.app = app
+            partial = _is_fragment_rerun()
+            count(name, "fragment_rerun" if partial else "full_rerun")
+            try:
+                with _timed_section(f"fragment:{name}"):
+                    return func(*args, **kwargs)
+            finally:
+                if partial:
+                    # スクリプト末尾の end_rerun() を通らないので、ここで書き出す
+                    flush()
+
+        return st.fragment(wrapper, **fragment_kwargs)
+    return decorator
+
+
+def plotly_chart(fig, name, **kwargs):
+    """st.plotly_chart の計測付きラッパー
+
+    データ配列はコンパクトなバイナリ表現に変換してから送る（common.figure_encoding）。
+    有効時はフィギュアの JSON シリアライズ時間とサイズ、st.plotly_chart 呼び出し時間を別々に記録する。
+    """
+    import streamlit as st
+
+    from common import figure_encoding
+
+    if figure_encoding.enabled():
+        with section(f"{name}:encode"):
+            figure_encoding.compact_figure(fig)
+    if not _state["enabled"]:
+        return st.plotly_chart(fig, **kwargs)
+    with _timed_section(f"{name}:serialize"):
+        payload = fig.to_json()
+    observe_payload(name, len(payload.encode("utf-8")))
+    with _timed_section(f"{name}:transfer"):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def flush(force=False):
+    """APP_METRICS_FILE が設定されていれば集計結果を書き出す（FLUSH_INTERVAL ごと）"""
+    path = os.environ.get("APP_METRICS_FILE")
+    if not _state["enabled"] or not path:
+        return
+    # セッションごとのスクリプトスレッドから呼ばれるため、間隔の判定と更新はまとめて行う
+    now = time.monotonic()
+    with _flush_lock:
+        if not force and now - _state["last_flush"] < FLUSH_INTERVAL:
+            return
+        _state["last_flush"] = now
+
+    path = path.replace("{app}", _current_app())
+    if path.endswith(".json"):
+        body = json.dumps(REGISTRY.snapshot(), ensure_ascii=False, indent=2)
+    else:
+        body = REGISTRY.render_prometheus()
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+    except OSError:
+        # 書き出しの失敗でページ（app3 の自動更新ループなど）を止めない
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(REGISTRY.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server(port):
+    with _server_lock:
+        if _state["server"] is not None:
+            return
+        server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True)
+        thread.start()
+        _state["server"] = server
@@ -0,0 +1,230 @@
+"""アプリごとに複数の Streamlit ワーカープロセスを起動するランチャー
+
+Streamlit は1プロセスで全セッションを処理するため、GIL により CPU を使う処理（app2 の学習、
+app1 の大きな図の構築）は1コアを奪い合う。このランチャーは1アプリにつき N 個のワーカーを
+連番ポートで起動し、/{app}/_stcore/health を定期的に確認して落ちた・応答しないワーカーを再起動する。
+セッションは WebSocket 上でワーカーに固定されるため、nginx 側はスティッキーセッションにする必要がある。
+
+使い方（コンテナ内、WORKDIR=/app）:
+    # app1 のワーカーを4つ（8501〜8504）起動して監視する
+    python -m common.launcher run --app app1 --workers 4
+
+    # 上記に対応する nginx 設定を nginx.conf から生成する（リポジトリのルートで実行）
+    python apps/common/launcher.py nginx --workers app1=4 app2=4 app3=2 --output nginx.workers.conf
+"""
+import argparse
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+APPS_DIR = Path(__file__).resolve().parent.parent
+
+BASE_PORT = 8501
+CHECK_INTERVAL = 5.0
+# 起動直後はインポートやウォームアップで応答しないため、この間の失敗は数えない（秒）
+START_PERIOD = 60.0
+MAX_FAILURES = 3
+MAX_BACKOFF = 30.0
+
+# スティッキーセッション用の Cookie（nginx が初回アクセス時に発行する）
+STICKY_COOKIE = "streamlit_worker"
+
+logger = logging.getLogger("launcher")
+
+
+class Worker:
+    """1つの Streamlit サーバープロセスとそのヘルス状態"""
+
+    def __init__(self, app, index, port, metrics_port=None):
+        self.app = app
+        self.index = index
+        self.port = port
+        self.metrics_port = metrics_port
+        self.proc = None
+        self.started_at = 0.0
+        self.failures = 0
+        self.restarts = 0
+        self.backoff = 1.0
+
+    @property
+    def health_url(self):
+        return f"http://127.0.0.1:{self.port}/{self.app}/_stcore/health"
+
+    def start(self):
+        env = dict(os.environ)
+        if self.metrics_port is not None:
+            # 計測のエクスポーターはワーカーごとに別ポートで公開する
+            env["APP_METRICS_PORT"] = str(self.metrics_port)
+        # 各ワーカーもウォームアップしてからサーバーを起動する（common.warmup）
+        self.proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "common.warmup", self.app,
+                f"--server.port={self.port}", "--server.address=0.0.0.0",
+                f"--server.baseUrlPath=/{self.app}", "--server.headless=true",
+                "--server.enableCORS=false", "--server.enableXsrfProtection=false",
+            ],
+            cwd=APPS_DIR,
+            env=env,
+        )
+        self.started_at = time.monotonic()
+        self.failures = 0
+        logger.info("%s[%d] started on port %d (pid %d)", self.app, self.index, self.port, self.proc.pid)
+
+    def stop(self, timeout=10):
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def healthy(self):
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=3) as response:
+                return response.status == 200
+        except OSError:
+            return False
+
+    def check(self):
+        """ヘルスチェックを1回行い、再起動が必要なら理由を返す"""
+        code = self.proc.poll()
+        if code is not None:
+            return f"exited with code {code}"
+        if self.healthy():
+            self.failures = 0
+            return None
+        if time.monotonic() - self.started_at < START_PERIOD:
+            return None
+        self.failures += 1
+        if self.failures >= MAX_FAILURES:
+            return f"health check failed {self.failures} times"
+        return None
+
+    def restart(self, reason):
+        # 起動直後に落ち続ける場合は再起動の間隔を広げる
+        if time.monotonic() - self.started_at < START_PERIOD:
+            self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+        else:
+            self.backoff = 1.0
+        logger.warning("%s[%d] %s; restarting in %.0fs", self.app, self.index, reason, self.backoff)
+        self.stop()
+        time.sleep(self.backoff)
+        self.restarts += 1
+        self.start()
+
+
+def run(app, workers, base_port=BASE_PORT, interval=CHECK_INTERVAL):
+    """ワーカーを起動し、SIGTERM / SIGINT を受けるまで監視して再起動する"""
+    metrics_port = os.environ.get("APP_METRICS_PORT")
+    pool = [
+        Worker(app, i, base_port + i, int(metrics_port) + i if metrics_port else None)
+        for i in range(workers)
+    ]
+    stopping = threading.Event()
+
+    def shutdown(signum, frame):
+        logger.info("received signal %d; stopping workers", signum)
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for worker in pool:
+        worker.start()
+    try:
+        while not stopping.wait(interval):
+            for worker in pool:
+                reason = worker.check()
+                if reason is not None and not stopping.is_set():
+                    worker.restart(reason)
+    finally:
+        for worker in pool:
+            worker.stop()
+
+
+def render_upstreams(workers, base_port=BASE_PORT):
+    """アプリごとのワーカー数から、Cookie でスティッキーにした upstream ブロックを生成する"""
+    lines = [
+        "# 初回アクセス時にランダムなキーを Cookie で発行し、以後は同じワーカーへ振り分ける",
+        f"map $cookie_{STICKY_COOKIE} $streamlit_worker_key {{",
+        '    ""      $request_id;',
+        f"    default $cookie_{STICKY_COOKIE};",
+        "}",
+        f'add_header Set-Cookie "{STICKY_COOKIE}=$streamlit_worker_key; Path=/; HttpOnly; SameSite=Lax";',
+        "",
+    ]
+    for app, count in workers.items():
+        lines.append(f"upstream {app} {{")
+        lines.append("    hash $streamlit_worker_key consistent;")
+        for i in range(count):
+            lines.append(f"    server {app}:{base_port + i} max_fails=3 fail_timeout=10s;")
+        lines.append("}")
+        lines.append("")
+    return "\n".join("    " + line if line else "" for line in lines)
+
+
+def render_nginx(template, workers, base_port=BASE_PORT):
+    """nginx.conf の upstream appN ブロックをワーカー数に合わせたスティッキー設定に置き換える"""
+    pattern = re.compile(r"^ *upstream (\w+) \{[^}]*\}\n(?:[ \t]*\n)*", re.MULTILINE)
+    found = pattern.findall(template)
+    missing = set(workers) - set(found)
+    if missing:
+        raise ValueError(f"nginx.conf に upstream がありません: {', '.join(sorted(missing))}")
+    # 先頭の upstream の位置に生成したブロックをまとめて挿入し、残りは削除する
+    first = pattern.search(template)
+    upstreams = render_upstreams({app: workers.get(app, 1) for app in found}, base_port)
+    body = pattern.sub("", template[first.start():])
+    return template[:first.start()] + upstreams + "\n" + body
+
+
+def parse_workers(items):
+    workers = {}
+    for item in items:
+        app, _, count = item.partition("=")
+        workers[app] = int(count or 1)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit マルチワーカーランチャー")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="ワーカーを起動して監視する")
+    run_parser.add_argument("--app", required=True, help="アプリ名（app1 など）")
+    run_parser.add_argument("--workers", type=int,
+                            default=int(os.environ.get("STREAMLIT_WORKERS", os.cpu_count() or 1)),
+                            help="ワーカー数（既定: STREAMLIT_WORKERS または CPU 数）")
+    run_parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    run_parser.add_argument("--interval", type=float, default=CHECK_INTERVAL, help="ヘルスチェック間隔（秒）")
+
+    nginx_parser = sub.add_parser("nginx", help="ワーカー構成に合わせた nginx 設定を生成する")
+    nginx_parser.add_argument("--workers", nargs="+", required=True, metavar="APP=N")
+    nginx_parser.add_argument("--template", type=Path, default=APPS_DIR.parent / "nginx.conf")
+    nginx_parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    nginx_parser.add_argument("--output", type=Path, help="出力先（省略時は標準出力）")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.command == "run":
+        run(args.app, args.workers, args.base_port, args.interval)
+    else:
+        config = render_nginx(args.template.read_text(encoding="utf-8"), parse_workers(args.workers),
+                              args.base_port)
+        if args.output:
+            args.output.write_text(config, encoding="utf-8")
+        else:
+            sys.stdout.write(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""セッション単位のメモリ計上とアイドルセッションの退避
+
+Streamlit はブラウザのタブごとにセッションを持ち、st.session_state の中身はタブが放置されても残り続ける。
+このモジュールはセッションごとの st.session_state のおおよそのバイト数を計上し、
+- セッション予算（APP_SESSION_BUDGET_MB）を超えたキーはアプリが登録したコンパクタで縮める
+- 一定時間操作のないセッション（APP_SESSION_IDLE_SECONDS）は退避（縮小または削除）する
+- プロセス全体の予算（APP_PROCESS_BUDGET_MB）を超えたら最も古いセッションから退避する
+ことで、放置タブによってタスクのメモリが増え続けないようにする。
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from common import bounded_cache
+
+MB = 1024 * 1024
+
+SESSION_BUDGET = int(float(os.environ.get("APP_SESSION_BUDGET_MB", "64")) * MB)
+PROCESS_BUDGET = int(float(os.environ.get("APP_PROCESS_BUDGET_MB", "512")) * MB)
+IDLE_SECONDS = float(os.environ.get("APP_SESSION_IDLE_SECONDS", "900"))
+
+# 全セッションの掃除は頻繁に行う必要がないため間引く（秒）
+SWEEP_INTERVAL = 10.0
+
+# 大きなコンテナはこの個数だけ標本を測って全体を推定する
+SAMPLE_ITEMS = 32
+MAX_DEPTH = 6
+
+_ATOMIC = (str, bytes, int, float, bool, complex, type(None), datetime, date)
+
+
+def estimate_size(obj, _seen=None, _depth=0):
+    """オブジェクトのおおよそのバイト数（pandas/NumPy は実データ量、大きなコンテナは標本から推定）"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        # データを所有する配列は getsizeof にバッファ分が含まれ、ビューは含まれない
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj, 64)
+    if isinstance(obj, _ATOMIC) or _depth >= MAX_DEPTH:
+        return size
+
+    if isinstance(obj, dict):
+        items = list(obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = list(obj)
+    elif hasattr(obj, "__dict__"):
+        items = list(vars(obj).items())
+    else:
+        return size
+
+    n = len(items)
+    if n > SAMPLE_ITEMS:
+        # 均等に間引いた標本から全体を推定する
+        step = n / SAMPLE_ITEMS
+        sample = [items[int(i * step)] for i in range(SAMPLE_ITEMS)]
+        measured = sum(estimate_size(item, _seen, _depth + 1) for item in sample)
+        return size + int(measured * n / SAMPLE_ITEMS)
+    return size + sum(estimate_size(item, _seen, _depth + 1) for item in items)
+
+
+def thin_history(history, target_bytes, keep_latest=60):
+    """時系列のリストを、新しい部分は保ったまま古い部分を間引いて target_bytes 以下に縮める
+
+    target_bytes が0の場合（退避）は直近 keep_latest 件だけを残す。
+    """
+    if target_bytes <= 0:
+        return history[-keep_latest:]
+    history = list(history)
+    while len(history) > keep_latest and estimate_size(history) > target_bytes:
+        split = max(0, len(history) - max(keep_latest, len(history) // 4))
+        history = history[:split:2] + history[split:]
+        if split <= 1:
+            break
+    return history
+
+
+@dataclass
+class SessionRecord:
+    session_id: str
+    app: str
+    state_ref: weakref.ref
+    last_active: float
+    key_bytes: dict = field(default_factory=dict)
+    compactions: int = 0
+    evictions: int = 0
+    # 退避済み（利用者が操作するまで掃除の対象にしない）
+    evicted: bool = False
+
+    @property
+    def total_bytes(self):
+        return sum(self.key_bytes.values())
+
+
+class SessionAccountant:
+    """プロセス内の全セッションのメモリ計上と予算の適用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions = {}
+        self.compactors = {}
+        self.last_sweep = 0.0
+        self.evicted_sessions = 0
+
+    def register_compactor(self, key, compactor):
+        """st.session_state[key] を縮める関数 compactor(value, target_bytes) を登録する
+
+        compactor は縮めた値を返す（None を返すとキーを削除する）。
+        target_bytes が0の場合はアイドルセッションの退避を意味する。
+        """
+        self.compactors[key] = compactor
+
+    def account(self, app, active=True):
+        """現在のセッションを計測し、予算を適用する（active=True は利用者の操作として記録）"""
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            record = self.sessions.get(ctx.session_id)
+            if record is None:
+                record = self.sessions[ctx.session_id] = SessionRecord(
+                    ctx.session_id, app, weakref.ref(ctx.session_state), now
+                )
+            if active:
+                record.last_active = now
+                record.evicted = False
+
+        state = ctx.session_state
+        self._measure(record, state)
+        if record.total_bytes > SESSION_BUDGET:
+            self._compact(record, state, SESSION_BUDGET)
+
+        if now - self.last_sweep >= SWEEP_INTERVAL:
+            self.last_sweep = now
+            self.sweep(exclude=ctx.session_id)
+        return record
+
+    def _measure(self, record, state):
+        record.key_bytes = {key: estimate_size(value) for key, value in state.filtered_state.items()}
+
+    def _compact(self, record, state, budget):
+        """登録済みのキーを大きい順に縮めて budget 以下に収める"""
+        targets = sorted(
+            (key for key in record.key_bytes if key in self.compactors),
+            key=lambda key: record.key_bytes[key],
+            reverse=True,
+        )
+        for key in targets:
+            if record.total_bytes <= budget:
+                break
+            others = record.total_bytes - record.key_bytes[key]
+            target = max(0, budget - others) if budget else 0
+            before = record.key_bytes[key]
+            compacted = self.compactors[key](state[key], target)
+            if compacted is None:
+                del state[key]
+                record.key_bytes.pop(key)
+            else:
+                state[key] = compacted
+                record.key_bytes[key] = estimate_size(compacted)
+            # 実際に縮んだ場合だけ数える
+            if record.key_bytes.get(key, 0) >= before:
+                continue
+            if budget:
+                record.compactions += 1
+            else:
+                record.evictions += 1
+
+    def _evict(self, record):
+        """コンパクタのあるキーを縮め、退避済みとして印を付ける
+
+        コンパクタのないキー（ウィジェットの値など）は残るため、保持量は0にならない。
+        退避済みのセッションは次に操作されるまで掃除の対象から外す。
+        """
+        state = record.state_ref()
+        record.evicted = True
+        if state is None:
+            return
+        before = record.total_bytes
+        self._compact(record, state, 0)
+        if record.total_bytes < before:
+            self.evicted_sessions += 1
+
+    def sweep(self, exclude=None):
+        """終了したセッションを忘れ、アイドルセッションとプロセス予算超過分を退避する"""
+        now = time.monotonic()
+        with self._lock:
+            for session_id in [sid for sid, r in self.sessions.items() if r.state_ref() is None]:
+                del self.sessions[session_id]
+            candidates = sorted(
+                (r for r in self.sessions.values() if r.session_id != exclude and not r.evicted),
+                key=lambda r: r.last_active,
+            )
+
+        for record in candidates:
+            if now - record.last_active >= IDLE_SECONDS:
+                self._evict(record)
+
+        # アイドルでなくても、プロセス予算を超えていれば古い順に退避する
+        for record in candidates:
+            if self.total_bytes() <= PROCESS_BUDGET:
+                break
+            if not record.evicted:
+                self._evict(record)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(r.total_bytes for r in self.sessions.values())
+
+    def report(self):
+        """セッション・キャッシュ・プロセスのメモリ状況を返す"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = pd.DataFrame([
+                {
+                    "セッション": r.session_id[:8],
+                    "アプリ": r.app,
+                    "保持量 (KiB)": round(r.total_bytes / 1024, 1),
+                    "アイドル (秒)": round(now - r.last_active),
+                    "圧縮回数": r.compactions,
+                    "退避回数": r.evictions,
+                }
+                for r in self.sessions.values()
+            ])
+        caches = pd.DataFrame(
+            [{"キャッシュ": name, "保持量 (KiB)": round(nbytes / 1024, 1)}
+             for name, nbytes in streamlit_cache_bytes().items()]
+            + [
+                {
+                    "キャッシュ": cache["name"],
+                    "保持量 (KiB)": round(cache["bytes"] / 1024, 1),
+                    "件数": cache["entries"],
+                    "上限 (KiB)": round(cache["max_bytes"] / 1024),
+                    "ヒット/ミス": f"{cache['hit'] + cache['disk_hit']}/{cache['miss']}",
+                    "追い出し": cache["eviction"],
+                    "ディスク (KiB)": round(cache["disk_bytes"] / 1024, 1),
+                }
+                for cache in bounded_cache.stats()
+            ]
+        )
+        return {
+            "sessions": sessions,
+            "caches": caches,
+            "session_total": self.total_bytes(),
+            "process_rss": process_rss(),
+            "evicted_sessions": self.evicted_sessions,
+        }
+
+
+def streamlit_cache_bytes():
+    """Streamlit の統計プロバイダーから st.cache_data / st.cache_resource の保持量を関数ごとに集計する"""
+    try:
+        from streamlit.runtime import Runtime
+
+        stats = Runtime.instance().stats_mgr.get_stats()
+    except Exception:  # noqa: BLE001 - ランタイム外（ベンチマークなど）では集計しない
+        return {}
+    if isinstance(stats, dict):
+        # 新しい Streamlit は統計ファミリー名ごとの辞書を返す
+        stats = itertools.chain.from_iterable(stats.values())
+
+    totals = {}
+    for stat in stats:
+        category = getattr(stat, "category_name", "")
+        if "cache" not in category:
+            continue
+        name = stat.cache_name or category
+        totals[name] = totals.get(name, 0) + stat.byte_length
+    return totals
+
+
+def process_rss():
+    """プロセスの常駐メモリ（バイト）。Linux 以外では最大 RSS で代用する"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+ACCOUNTANT = SessionAccountant()
+
+
+def track(app, active=True):
+    """各リランの先頭（と自動更新ループの各ティック）で呼び、現在のセッションを計上する
+
+    リラン（利用者の操作）をアクティブとみなす。自動更新ループのティックは active=False で呼び、
+    計測だけ行う。操作されないまま IDLE_SECONDS が経過したセッションは、自動更新中でも退避対象になる。
+    """
+    return ACCOUNTANT.account(app, active)
+
+
+def register_compactor(key, compactor):
+    ACCOUNTANT.register_compactor(key, compactor)
+
+
+def render_report():
+    """サイドバーにメモリ使用状況を表示する（チェック時のみ集計）"""
+    import streamlit as st
+
+    with st.expander("🧮 メモリ使用状況"):
+        if not st.checkbox("集計する", key="_session_budget_report"):
+            return
+        report = ACCOUNTANT.report()
+        st.caption(
+            f"プロセス RSS: {report['process_rss'] / MB:.1f}MiB / "
+            f"セッション合計: {report['session_total'] / MB:.2f}MiB "
+            f"（予算 {SESSION_BUDGET / MB:g}MiB/セッション, {PROCESS_BUDGET / MB:g}MiB/プロセス） / "
+            f"退避済み: {report['evicted_sessions']}"
+        )
+        if not report["sessions"].empty:
+            st.dataframe(report["sessions"], hide_index=True, use_container_width=True)
+        if not report["caches"].empty:
+            st.dataframe(report["caches"], hide_index=True, use_container_width=True)
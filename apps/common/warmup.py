@@ -0,0 +1,129 @@
+"""起動時のウォームアップ
+
+Streamlit は起動するとすぐ /_stcore/health に応答するため、最初の利用者が重いモジュールの
+インポート、データキャッシュ（common.bounded_cache / st.cache_data）のミス、Plotly の初期化の費用を払うことになる。
+このモジュールはサーバーを起動する前に同じプロセスで
+1. 重いモジュールのインポート
+2. バイトコードのプリコンパイル（書き込めない場合は省略）
+3. ヘッドレス AppTest による各アプリのデフォルト設定での1回実行（キャッシュを埋める）
+を行い、その後で Streamlit サーバーを起動する。ヘルスチェックはサーバー起動後にしか通らないため、
+ウォームアップが終わるまでトラフィックは流れない。
+
+使い方（Dockerfile の CMD、WORKDIR=/app）:
+    python -m common.warmup app1 --server.port=8501 --server.address=0.0.0.0 ...
+    python -m common.warmup combined --server.port=8501 ...   # 統合構成は3アプリすべて
+
+APP_WARMUP=0 でウォームアップを省略してそのまま起動する。
+"""
+import compileall
+import importlib
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+APPS_DIR = Path(__file__).resolve().parent.parent
+APPS = ("app1", "app2", "app3")
+TIMEOUT = 300
+
+# アプリごとに事前にインポートする重いモジュール
+HEAVY_MODULES = {
+    "app1": ["pandas", "numpy", "plotly.express", "plotly.graph_objects"],
+    "app2": ["pandas", "numpy", "plotly.express", "plotly.graph_objects",
+             "sklearn.ensemble", "sklearn.linear_model", "sklearn.tree", "sklearn.model_selection",
+             "sklearn.datasets", "sklearn.metrics", "seaborn", "matplotlib.pyplot"],
+    "app3": ["pandas", "numpy", "plotly.express", "plotly.graph_objects", "plotly.subplots"],
+}
+
+logger = logging.getLogger("warmup")
+
+
+def import_modules(apps):
+    for name in dict.fromkeys(m for app in apps for m in HEAVY_MODULES[app]):
+        importlib.import_module(name)
+
+
+def compile_sources():
+    """apps 以下をバイトコードにコンパイルする（読み取り専用のマウントでは何もしない）"""
+    if not os.access(APPS_DIR, os.W_OK):
+        return False
+    return compileall.compile_dir(str(APPS_DIR), quiet=1)
+
+
+def run_defaults(app):
+    """ヘッドレスでアプリをデフォルト設定のまま1回実行し、キャッシュと描画経路を温める
+
+    AppTest は同じプロセスで実行されるため、common.bounded_cache（と st.cache_resource）の中身は
+    この後起動するサーバーと共有される。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(APPS_DIR / app / "app.py"), default_timeout=TIMEOUT)
+    if app == "app3":
+        # 自動更新ループは1ティックで抜ける
+        previous = os.environ.get("APP3_MAX_TICKS")
+        os.environ["APP3_MAX_TICKS"] = "1"
+        try:
+            at.run()
+        finally:
+            if previous is None:
+                del os.environ["APP3_MAX_TICKS"]
+            else:
+                os.environ["APP3_MAX_TICKS"] = previous
+    else:
+        at.run()
+    if app == "app2" and not at.exception:
+        # デフォルト設定で「🚀 モデル実行」まで行い、データ生成と学習の経路を通す
+        for button in at.sidebar.button:
+            if button.label == "🚀 モデル実行":
+                button.click().run()
+    if at.exception:
+        raise RuntimeError(f"{app}: {at.exception[0].message}")
+
+
+def warm(target):
+    """ウォームアップを実行し、段階ごとの所要時間（秒）を返す"""
+    apps = APPS if target == "combined" else (target,)
+    timings = {}
+
+    start = time.perf_counter()
+    import_modules(apps)
+    timings["imports"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compile_sources()
+    timings["compile"] = time.perf_counter() - start
+
+    for app in apps:
+        start = time.perf_counter()
+        try:
+            run_defaults(app)
+        except Exception:  # noqa: BLE001 - ウォームアップの失敗でサーバーを起動できなくしない
+            logger.exception("%s の事前実行に失敗しました（ウォームアップなしで続行）", app)
+        timings[app] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in APPS + ("combined",):
+        sys.exit("usage: python -m common.warmup {app1|app2|app3|combined} [streamlit run options]")
+    target, flags = sys.argv[1], sys.argv[2:]
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if os.environ.get("APP_WARMUP", "1") != "0":
+        start = time.perf_counter()
+        timings = warm(target)
+        logger.info(
+            "%s warm-up finished in %.2fs (%s)", target, time.perf_counter() - start,
+            ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()),
+        )
+
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", "run", str(APPS_DIR / target / "app.py"), *flags]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""app3 ストリーミング異常検知のスループットベンチマーク
+
+使い方:
+    python benchmarks/bench_anomaly.py --samples 50000
+
+1サンプルずつ流し込む「ストリーミング」と、まとめて流し込む「バッチ」の両方で
+1コアあたりのサンプル/秒を計測する。
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps" / "app3"))
+
+from anomaly import METRICS, EwmaDetector, SeasonalDetector  # noqa: E402
+
+
+def make_stream(n_samples, n_metrics, seed=42):
+    """スパイクを含む合成ストリーム（1秒間隔）"""
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000 + np.arange(n_samples, dtype=float)
+    values = rng.normal(50, 5, size=(n_samples, n_metrics))
+    spikes = rng.random((n_samples, n_metrics)) < 0.01
+    values[spikes] += rng.uniform(30, 60, size=spikes.sum())
+    return timestamps, values
+
+
+def bench(detector, timestamps, values, streaming):
+    start = time.perf_counter()
+    if streaming:
+        n_flags = 0
+        for i in range(len(timestamps)):
+            _, flags = detector.update(timestamps[i:i + 1], values[i:i + 1])
+            n_flags += int(flags.sum())
+    else:
+        _, flags = detector.update(timestamps, values)
+        n_flags = int(flags.sum())
+    elapsed = time.perf_counter() - start
+    return elapsed, n_flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=50_000)
+    args = parser.parse_args()
+
+    timestamps, values = make_stream(args.samples, len(METRICS))
+    detectors = {
+        "EWMA z-score": lambda: EwmaDetector(),
+        "季節性ベースライン": lambda: SeasonalDetector(season=3600, n_bins=60),
+    }
+
+    print(f"samples={args.samples} metrics={len(METRICS)}")
+    print(f"{'detector':<20}{'mode':<12}{'samples/s':>14}{'metric-samples/s':>20}{'anomalies':>12}")
+    for name, factory in detectors.items():
+        for streaming in (True, False):
+            elapsed, n_flags = bench(factory(), timestamps, values, streaming)
+            rate = args.samples / elapsed
+            mode = "streaming" if streaming else "batch"
+            print(f"{name:<20}{mode:<12}{rate:>14,.0f}{rate * len(METRICS):>20,.0f}{n_flags:>12}")
+
+
+if __name__ == "__main__":
+    main()
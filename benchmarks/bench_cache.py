@@ -0,0 +1,100 @@
+"""パラメータ探索時のキャッシュ保持量の比較（st.cache_data vs common.bounded_cache）
+
+app2 の generate_data と同じデータ生成（make_classification）を、スライダーの組み合わせを
+ランダムに変えながら（一部は繰り返し）呼び出し、キャッシュが保持しているメモリ（tracemalloc）と
+ヒット率・1回あたりの所要時間を比較する。
+
+使い方:
+    python benchmarks/bench_cache.py
+    python benchmarks/bench_cache.py --calls 400 --max-mb 16 --disk /tmp/app-cache
+"""
+import argparse
+import random
+import shutil
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+APPS_DIR = Path(__file__).resolve().parent.parent / "apps"
+sys.path.insert(0, str(APPS_DIR))
+
+import streamlit as st  # noqa: E402
+from sklearn.datasets import make_classification  # noqa: E402
+
+from common import bounded_cache  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def generate_data(n_samples, n_features, n_classes, noise):
+    return make_classification(
+        n_samples=n_samples, n_features=n_features, n_classes=n_classes,
+        n_informative=min(n_features, n_classes), flip_y=noise, random_state=42,
+    )
+
+
+def parameter_stream(calls, seed=0):
+    """スライダー操作の列。直前の組み合わせに戻る操作（ヒット）を一定割合含む
+
+    make_classification が受け付ける範囲（特徴量数 >= 情報特徴量 + 冗長特徴量）に限る。
+    """
+    rng = random.Random(seed)
+    recent = []
+    for _ in range(calls):
+        if recent and rng.random() < 0.3:
+            yield rng.choice(recent[-5:])
+            continue
+        params = (
+            rng.randrange(100, 2001, 100), rng.randint(8, 20), rng.randint(2, 5),
+            rng.choice([0.0, 0.1, 0.2, 0.3]),
+        )
+        recent.append(params)
+        yield params
+
+
+def run(cached, calls):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for params in parameter_stream(calls):
+        cached(*params)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--max-mb", type=float, default=8)
+    parser.add_argument("--disk", help="ディスク層のディレクトリ（指定時のみ）")
+    args = parser.parse_args()
+
+    rows = []
+    held, per_call = run(st.cache_data(generate_data), args.calls)
+    rows.append(("st.cache_data", held, per_call, "-"))
+
+    variants = [("bounded", None)]
+    if args.disk:
+        shutil.rmtree(args.disk, ignore_errors=True)
+        variants.append(("bounded + disk", args.disk))
+    for label, disk_dir in variants:
+        cache = bounded_cache.BoundedCache(label, max_bytes=int(args.max_mb * MB), disk_dir=disk_dir or "")
+        held, per_call = run(cache.decorate(generate_data), args.calls)
+        stats = cache.stats()
+        hits = stats["hit"] + stats["disk_hit"]
+        detail = (f"hit {hits}/{hits + stats['miss']} (disk {stats['disk_hit']}), "
+                  f"evicted {stats['eviction']}, cache {stats['bytes'] / MB:.1f}MiB")
+        if disk_dir:
+            detail += f", disk {stats['disk_bytes'] / MB:.1f}MiB"
+        rows.append((label, held, per_call, detail))
+
+    print(f"calls={args.calls} max={args.max_mb:g}MiB")
+    print(f"{'cache':<16}{'held MiB':>10}{'ms/call':>10}  detail")
+    for label, held, per_call, detail in rows:
+        print(f"{label:<16}{held / MB:>10.1f}{per_call * 1000:>10.2f}  {detail}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""app3 フリート監視の1ティックあたりの処理時間
+
+使い方:
+    python benchmarks/bench_fleet.py
+    python benchmarks/bench_fleet.py --hosts 100 500 1000 --ticks 30
+
+ホスト数ごとに、列指向リングバッファ（fleet.FleetCollector）での1ティック分の処理
+（サンプル取り込み・フリート集計・上位 K 抽出・ドリルダウンの切り出し）と、
+ホスト × 時刻を1行ずつ持つ DataFrame を毎ティック groupby する素朴な実装を比較する。
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "apps" / "app3"))
+
+from fleet import CAPACITY_SECONDS, FleetCollector, build_samplers  # noqa: E402
+
+METRIC = "cpu_usage"
+TOP_K = 10
+
+
+def columnar_tick(collector, now, window):
+    collector.poll(now)
+    collector.latest_stats()
+    collector.fleet_series(METRIC, window)
+    top, _ = collector.top_hosts(METRIC, TOP_K)
+    collector.host_matrix(top, METRIC, window)
+    collector.host_series(int(top[0]), window)
+
+
+def naive_tick(frame, samplers, now, window):
+    """ホスト × 時刻の行を追記し、毎ティック時間窓全体を groupby で集計する"""
+    rows = []
+    for sampler in samplers:
+        values = sampler.sample(1)[0]
+        for host, row in zip(sampler.hosts, values):
+            rows.append({"timestamp": now, "host": host, **dict(zip(sampler.metrics, row))})
+    frame = pd.concat([frame, pd.DataFrame(rows)], ignore_index=True)
+    frame = frame[frame["timestamp"] > now - timedelta(seconds=window)]
+    by_time = frame.groupby("timestamp")[METRIC]
+    by_time.agg(["mean", "max", lambda s: s.quantile(0.95)])
+    recent = frame[frame["timestamp"] > now - timedelta(seconds=30)]
+    top = recent.groupby("host")[METRIC].mean().nlargest(TOP_K).index
+    frame[frame["host"].isin(top)].pivot(index="host", columns="timestamp", values=METRIC)
+    frame[frame["host"] == top[0]]
+    return frame
+
+
+def bench(n_hosts, ticks, window):
+    start_time = datetime(2024, 1, 1)
+    collector = FleetCollector(build_samplers(n_hosts))
+    # 保持期間いっぱいまで埋めてから計測する
+    collector.poll(start_time)
+    collector.poll(start_time + timedelta(seconds=window))
+    columnar = []
+    for i in range(1, ticks + 1):
+        now = start_time + timedelta(seconds=window + i)
+        t0 = time.perf_counter()
+        columnar_tick(collector, now, window)
+        columnar.append(time.perf_counter() - t0)
+
+    samplers = build_samplers(n_hosts)
+    frame = pd.DataFrame()
+    naive = []
+    for i in range(ticks):
+        now = start_time + timedelta(seconds=i)
+        t0 = time.perf_counter()
+        frame = naive_tick(frame, samplers, now, window)
+        naive.append(time.perf_counter() - t0)
+    return statistics.median(columnar), statistics.median(naive), collector.values.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, nargs="+", default=[50, 100, 500])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--window", type=int, default=CAPACITY_SECONDS)
+    args = parser.parse_args()
+
+    print(f"window={args.window}s ticks={args.ticks} (naive は時間窓が ticks 秒まで埋まった時点)")
+    print(f"{'hosts':>6}{'columnar ms':>14}{'naive ms':>12}{'buffer MiB':>13}")
+    for n_hosts in args.hosts:
+        columnar, naive, nbytes = bench(n_hosts, args.ticks, args.window)
+        print(f"{n_hosts:>6}{columnar * 1000:>14.2f}{naive * 1000:>12.1f}{nbytes / 2**20:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
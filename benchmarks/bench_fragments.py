@@ -0,0 +1,93 @@
+"""app1 のセクション単位の再実行（st.fragment）とページ全体のリランの比較
+
+ローカルに app1 の Streamlit サーバーを計測有効（APP_METRICS_ENABLED=1）で起動し、WebSocket セッションから
+セクション内のウィジェットを操作する。ブラウザと同じくフラグメント ID を付けて送る場合（scoped）と、
+付けずにページ全体をリランさせる場合（full、セクション分割前の挙動）で遅延と受信バイト数を比べ、
+最後にサーバーの /metrics.json からセクションごとの再実行回数と所要時間を表示する。
+
+使い方:
+    python benchmarks/bench_fragments.py
+    python benchmarks/bench_fragments.py --repeats 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import urllib.request
+
+from load_test import LOCAL_BASE_PORT, ROOT, StreamlitSession, launch_server, stream_url, wait_healthy
+
+METRICS_PORT = 9650
+
+# (ウィジェット種別, ラベル, 交互に設定する値)
+INTERACTIONS = [
+    ("slider", "移動平均期間", [20, 10]),
+    ("selectbox", "グラフタイプ", ["棒グラフ", "線グラフ"]),
+    ("radio", "分析タイプを選択:", ["分布分析", "トレンド分析"]),
+]
+
+
+async def measure(url, repeats):
+    session = StreamlitSession(url, "app1")
+    await session.connect()
+    try:
+        await session.rerun()
+        results = []
+        for kind, label, values in INTERACTIONS:
+            for mode in ("full", "scoped"):
+                latencies, received = [], []
+                for i in range(repeats):
+                    states, fragment_id = session.widget_states_after(kind, label, values[i % len(values)])
+                    latency, nbytes = await session.rerun(states, fragment_id if mode == "scoped" else "")
+                    latencies.append(latency)
+                    received.append(nbytes)
+                results.append((label, mode, statistics.median(latencies), statistics.mean(received)))
+        return results
+    finally:
+        await session.close()
+
+
+def fetch_metrics():
+    with urllib.request.urlopen(f"http://localhost:{METRICS_PORT}/metrics.json", timeout=5) as response:
+        return json.load(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="セクション単位の再実行とページ全体のリランの比較（app1）")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ["APP_METRICS_ENABLED"] = "1"
+    os.environ["APP_METRICS_PORT"] = str(METRICS_PORT)
+    proc = launch_server(ROOT / "apps" / "app1" / "app.py", LOCAL_BASE_PORT, "/app1")
+    try:
+        base_url = f"http://localhost:{LOCAL_BASE_PORT}"
+        wait_healthy(f"{base_url}/app1/_stcore/health", proc, "app1")
+        results = asyncio.run(measure(stream_url(base_url, "app1"), args.repeats))
+        metrics = fetch_metrics()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    print(f"{'widget':<20}{'mode':>8}{'p50 ms':>10}{'KiB/update':>12}")
+    for label, mode, latency, nbytes in results:
+        print(f"{label:<20}{mode:>8}{latency * 1000:>10.1f}{nbytes / 1024:>12.1f}")
+
+    counts = {}
+    for counter in metrics["counters"]:
+        if counter["kind"] in ("full_rerun", "fragment_rerun"):
+            counts.setdefault(counter["name"], {})[counter["kind"]] = counter["value"]
+    timings = {s["section"]: s for s in metrics["sections"]}
+    print()
+    print(f"{'section':<14}{'full':>7}{'fragment':>10}{'mean ms':>10}")
+    for name, kinds in sorted(counts.items()):
+        mean = timings.get(f"fragment:{name}", {}).get("mean", 0.0)
+        print(f"{name:<14}{kinds.get('full_rerun', 0):>7}{kinds.get('fragment_rerun', 0):>10}{mean * 1000:>10.1f}")
+    rerun = timings.get("rerun")
+    if rerun:
+        print(f"{'(page rerun)':<14}{rerun['count']:>7}{'':>10}{rerun['mean'] * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""3コンテナ構成と統合構成（1サーバーに3ページ）の起動時間・メモリ比較
+
+- separate: 各アプリを個別の Streamlit サーバーとして起動（docker-compose.yml と同じ構成）
+- combined: apps/combined/app.py を1つ起動（docker-compose.combined.yml と同じ構成）
+
+それぞれについて、全サーバーが /_stcore/health に応答するまでの時間、アイドル時の RSS 合計、
+各アプリを1セッションずつ開いた後の RSS 合計と初回描画の遅延を計測する。
+
+使い方:
+    python benchmarks/bench_layouts.py
+    python benchmarks/bench_layouts.py --repeats 3 --output layouts.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+from load_test import (
+    APPS,
+    LOCAL_BASE_PORT,
+    ROOT,
+    StreamlitSession,
+    launch_server,
+    read_rss,
+    stream_url,
+    wait_healthy,
+)
+
+LAYOUTS = ("separate", "combined")
+
+
+def start_layout(layout):
+    """構成を起動し、[(アプリ, ベース URL, ページ名, プロセス)] と起動時間を返す"""
+    start = time.perf_counter()
+    if layout == "combined":
+        proc = launch_server(ROOT / "apps" / "combined" / "app.py", LOCAL_BASE_PORT)
+        base_url = f"http://localhost:{LOCAL_BASE_PORT}"
+        wait_healthy(f"{base_url}/_stcore/health", proc, "combined")
+        targets = [(app, base_url, app, proc) for app in APPS]
+    else:
+        targets = []
+        for i, app in enumerate(APPS):
+            proc = launch_server(ROOT / "apps" / app / "app.py", LOCAL_BASE_PORT + i, f"/{app}")
+            targets.append((app, f"http://localhost:{LOCAL_BASE_PORT + i}", "", proc))
+        for app, base_url, _, proc in targets:
+            wait_healthy(f"{base_url}/{app}/_stcore/health", proc, app)
+    return targets, time.perf_counter() - start
+
+
+def total_rss(procs):
+    return sum(read_rss(proc.pid) or 0 for proc in procs)
+
+
+async def open_apps(targets, combined):
+    """各アプリを1セッションずつ開き、初回描画までの遅延（秒）を返す"""
+    sessions = []
+    latencies = {}
+    for app, base_url, page_name, _ in targets:
+        session = StreamlitSession(stream_url(base_url, app, combined), app, page_name)
+        await session.connect()
+        latencies[app], _ = await session.rerun()
+        sessions.append(session)
+    return sessions, latencies
+
+
+async def measure(layout):
+    targets, startup = start_layout(layout)
+    procs = list({proc.pid: proc for *_, proc in targets}.values())
+    try:
+        idle_rss = total_rss(procs)
+        sessions, latencies = await open_apps(targets, layout == "combined")
+        loaded_rss = total_rss(procs)
+        for session in sessions:
+            await session.close()
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait(timeout=10)
+    return {
+        "processes": len(procs),
+        "startup_s": startup,
+        "idle_rss_mib": idle_rss / 2**20,
+        "loaded_rss_mib": loaded_rss / 2**20,
+        **{f"{app}_first_render_ms": latency * 1000 for app, latency in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="3コンテナ構成と統合構成の起動時間・メモリ比較")
+    parser.add_argument("--repeats", type=int, default=1, help="各構成の計測回数（中央値を表示）")
+    parser.add_argument("--output", type=Path, help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    results = {}
+    for layout in LAYOUTS:
+        runs = [asyncio.run(measure(layout)) for _ in range(args.repeats)]
+        results[layout] = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    keys = list(results[LAYOUTS[0]])
+    print(f"{'':<22}" + "".join(f"{layout:>12}" for layout in LAYOUTS))
+    for key in keys:
+        print(f"{key:<22}" + "".join(f"{results[layout][key]:>12.1f}" for layout in LAYOUTS))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
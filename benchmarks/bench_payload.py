@@ -0,0 +1,85 @@
+"""グラフのペイロード（1更新あたりのバイト数）の比較
+
+各アプリをヘッドレス AppTest で実行し、描画された Plotly チャートの spec（ブラウザへ送る JSON）の
+合計バイト数とリラン時間を、コンパクト表現（common.figure_encoding）の無効/有効で比較する。
+app3 は表示期間いっぱいの履歴を持った状態での1ティック分（= 1秒ごとの更新1回分）を計測する。
+
+使い方:
+    python benchmarks/bench_payload.py
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("APP3_MAX_TICKS", "1")
+
+from bench_reruns import APPS_DIR, TIMEOUT, check, make_history, widget  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+CASES = {
+    "app1 線グラフ": ("app1", {"データポイント数": 1000, "グラフタイプ": "線グラフ"}),
+    "app1 散布図": ("app1", {"データポイント数": 1000, "グラフタイプ": "散布図"}),
+    "app1 ヒートマップ": ("app1", {"データポイント数": 1000, "グラフタイプ": "ヒートマップ"}),
+    "app2 分類": ("app2", {"サンプル数": 2000}),
+    "app3 1ティック (10分)": ("app3", {"データ表示期間": "10分"}),
+    "app3 1ティック (1時間)": ("app3", {"データ表示期間": "1時間"}),
+}
+WINDOW_SECONDS = {"10分": 600, "1時間": 3600}
+
+
+def setup(app, params):
+    at = AppTest.from_file(str(APPS_DIR / app / "app.py"), default_timeout=TIMEOUT)
+    if app == "app3":
+        at.session_state["history_data"] = make_history(WINDOW_SECONDS[params["データ表示期間"]])
+    check(at.run())
+    for label, value in params.items():
+        # サイドバーの設定と、セクション内（st.fragment）のウィジェットの両方を探す
+        for elements in (at.sidebar.slider, at.sidebar.selectbox, at.slider, at.selectbox):
+            try:
+                widget(elements, label).set_value(value)
+                break
+            except LookupError:
+                continue
+    return at
+
+
+def rerun(at, app, params):
+    if app == "app2":
+        return check(widget(at.sidebar.button, "🚀 モデル実行").click().run())
+    if app == "app3":
+        at.session_state["history_data"] = make_history(WINDOW_SECONDS[params["データ表示期間"]])
+    return check(at.run())
+
+
+def chart_bytes(at):
+    return sum(len(chart.proto.spec.encode("utf-8")) for chart in at.get("plotly_chart"))
+
+
+def measure(app, params, compact, repeats):
+    os.environ["APP_COMPACT_FIGURES"] = "1" if compact else "0"
+    at = setup(app, params)
+    rerun(at, app, params)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rerun(at, app, params)
+        times.append(time.perf_counter() - start)
+    return chart_bytes(at), statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="グラフのペイロード比較（JSON リスト vs 型付き配列）")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'case':<26}{'before KiB':>12}{'after KiB':>12}{'ratio':>8}{'before ms':>11}{'after ms':>10}")
+    for case, (app, params) in CASES.items():
+        before, before_s = measure(app, params, False, args.repeats)
+        after, after_s = measure(app, params, True, args.repeats)
+        print(f"{case:<26}{before / 1024:>12.1f}{after / 1024:>12.1f}{after / before:>8.0%}"
+              f"{before_s * 1000:>11.0f}{after_s * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""app3 のトレースリプレイによる高レート取り込みの計測
+
+ヘッドレス AppTest で app3 を起動し、シードから生成したトレース（またはファイル）を再生速度ごとに
+数ティック再生して、取り込みスループット・ティック遅延（p50/p95）・破棄したサンプル数を表示する。
+取り込みから描画までアプリと同じ経路（異常検知 → 履歴 → アラート評価 → グラフ）を通る。
+
+使い方:
+    python benchmarks/bench_replay.py
+    python benchmarks/bench_replay.py --speeds 100 1000 --ticks 10 --max-batch 500
+    python benchmarks/bench_replay.py --trace trace.npz
+"""
+import argparse
+import os
+
+from bench_reruns import APPS_DIR, TIMEOUT, check, widget
+
+
+def measure(speed, ticks, trace, window):
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["APP3_MAX_TICKS"] = "1"
+    at = check(AppTest.from_file(str(APPS_DIR / "app3" / "app.py"), default_timeout=TIMEOUT).run())
+    widget(at.sidebar.selectbox, "更新間隔").set_value(1)
+    widget(at.sidebar.selectbox, "データ表示期間").set_value(window)
+    widget(at.sidebar.checkbox, "トレースを再生").check()
+    check(at.run())
+    if trace:
+        widget(at.sidebar.radio, "トレース").set_value("ファイル")
+        check(at.run())
+        widget(at.sidebar.text_input, "トレースファイル (.jsonl / .npz)").input(trace)
+    widget(at.sidebar.select_slider, "再生速度").set_value(speed)
+    check(at.run())
+
+    os.environ["APP3_MAX_TICKS"] = str(ticks)
+    check(at.run())
+    return at.session_state["replay"].stats(), len(at.session_state["history_data"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="app3 トレースリプレイの取り込み計測")
+    parser.add_argument("--speeds", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--ticks", type=int, default=5, help="速度ごとのティック数（1ティック = 更新間隔1秒 + 処理時間）")
+    parser.add_argument("--window", default="10分", help="データ表示期間")
+    parser.add_argument("--trace", help="再生するトレース（.jsonl / .npz）。省略時はシードから生成")
+    parser.add_argument("--max-batch", type=int, help="1ティックで取り込むサンプル数の上限（APP3_REPLAY_MAX_BATCH）")
+    args = parser.parse_args()
+    if args.max_batch:
+        os.environ["APP3_REPLAY_MAX_BATCH"] = str(args.max_batch)
+
+    print(f"{'speed':>7}{'samples/s':>12}{'tick p50 ms':>13}{'tick p95 ms':>13}{'dropped':>10}{'history':>9}")
+    for speed in args.speeds:
+        stats, history = measure(speed, args.ticks, args.trace, args.window)
+        print(f"{speed:>6}×{stats['throughput']:>12,.0f}{stats['tick_p50_ms']:>13.0f}"
+              f"{stats['tick_p95_ms']:>13.0f}{stats['dropped']:>10,}{history:>9}")
+
+
+if __name__ == "__main__":
+    main()
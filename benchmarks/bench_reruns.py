@@ -0,0 +1,292 @@
+"""3アプリのヘッドレス・リラン遅延ベンチマーク
+
+Streamlit のヘッドレス AppTest ハーネスで各アプリをパラメータグリッドに沿って実行し、
+コールド（キャッシュ空）とウォーム（同一パラメータで再実行）のリラン遅延、
+ピークメモリ（tracemalloc）を記録してベースラインと比較する。
+
+使い方:
+    python benchmarks/bench_reruns.py                      # 全グリッドを実行して表示
+    python benchmarks/bench_reruns.py --quick --app app1   # 縮小グリッド
+    python benchmarks/bench_reruns.py --save-baseline      # 結果をベースラインとして保存
+    python benchmarks/bench_reruns.py --compare            # ベースラインと比較（回帰があれば終了コード1）
+
+app3 の自動更新ループは APP3_MAX_TICKS=1 で1ティックに制限し、
+履歴バッファは表示期間いっぱいの合成サンプルで事前に埋める。
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+os.environ.setdefault("APP3_MAX_TICKS", "1")
+
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+APPS_DIR = ROOT / "apps"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+TIMEOUT = 300
+
+if str(APPS_DIR) not in sys.path:
+    sys.path.insert(0, str(APPS_DIR))
+
+from common import bounded_cache  # noqa: E402
+
+APP1_GRID = {
+    "data_points": [100, 500, 1000],
+    "categories": [["売上"], ["売上", "利益"], ["売上", "利益", "顧客数", "製品数"]],
+    "chart_type": ["線グラフ", "棒グラフ", "散布図", "ヒートマップ"],
+}
+APP2_GRID = {
+    "task_type": ["分類 (Classification)", "回帰 (Regression)"],
+    "n_samples": [500, 2000],
+    "n_features": [5, 20],
+    "algorithm": ["Random Forest", "Logistic Regression", "Decision Tree", "Linear Regression"],
+}
+APP3_GRID = {
+    "time_window": ["1分", "10分", "1時間"],
+    "monitored": [
+        ("CPU",),
+        ("CPU", "メモリ"),
+        ("CPU", "メモリ", "ネットワーク", "ディスク"),
+    ],
+}
+QUICK_GRIDS = {
+    "app1": {"data_points": [100, 1000], "categories": [["売上", "利益"]], "chart_type": ["線グラフ", "棒グラフ"]},
+    "app2": {"task_type": ["分類 (Classification)"], "n_samples": [500], "n_features": [10],
+             "algorithm": ["Random Forest", "Logistic Regression"]},
+    "app3": {"time_window": ["1分", "1時間"], "monitored": [("CPU", "メモリ", "ネットワーク", "ディスク")]},
+}
+
+APP2_ALGORITHMS = {
+    "分類 (Classification)": {"Random Forest", "Logistic Regression", "Decision Tree"},
+    "回帰 (Regression)": {"Random Forest", "Linear Regression"},
+}
+APP3_MONITOR_LABELS = {
+    "CPU": "💻 CPU使用率",
+    "メモリ": "🧠 メモリ使用率",
+    "ネットワーク": "🌐 ネットワーク",
+    "ディスク": "💾 ディスク使用率",
+}
+APP3_WINDOW_SECONDS = {"1分": 60, "5分": 300, "10分": 600, "30分": 1800, "1時間": 3600}
+
+
+def grid_points(grid):
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield dict(zip(keys, values))
+
+
+def widget(elements, label):
+    """ラベルでウィジェットを探す（アプリ側はウィジェットに key を付けていないため）"""
+    for element in elements:
+        if element.label == label:
+            return element
+    raise LookupError(f"ウィジェットが見つかりません: {label}")
+
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+# ----------------------------------------------------------------------------
+# アプリごとのシナリオ: (AppTest を準備する関数, 計測対象のリランを実行する関数) を返す
+# ----------------------------------------------------------------------------
+def app1_scenario(params):
+    def setup():
+        at = check(AppTest.from_file(str(APPS_DIR / "app1" / "app.py"), default_timeout=TIMEOUT).run())
+        widget(at.sidebar.slider, "データポイント数").set_value(params["data_points"])
+        widget(at.sidebar.multiselect, "カテゴリー選択").set_value(params["categories"])
+        widget(at.selectbox, "グラフタイプ").set_value(params["chart_type"])
+        return at
+
+    return setup, lambda at: check(at.run())
+
+
+def app2_scenario(params):
+    def setup():
+        at = check(AppTest.from_file(str(APPS_DIR / "app2" / "app.py"), default_timeout=TIMEOUT).run())
+        widget(at.sidebar.selectbox, "🎯 タスクタイプ").set_value(params["task_type"])
+        check(at.run())
+        widget(at.sidebar.selectbox, "🔧 アルゴリズム").set_value(params["algorithm"])
+        widget(at.sidebar.slider, "サンプル数").set_value(params["n_samples"])
+        widget(at.sidebar.slider, "特徴量数").set_value(params["n_features"])
+        return check(at.run())
+
+    def rerun(at):
+        # 「🚀 モデル実行」でデータ生成・学習・予測・描画までを1リランで実行する
+        return check(widget(at.sidebar.button, "🚀 モデル実行").click().run())
+
+    return setup, rerun
+
+
+def make_history(window_seconds, seed=42):
+    """表示期間いっぱいの合成履歴（1秒間隔）"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    return [
+        {
+            "timestamp": now - timedelta(seconds=window_seconds - 1 - i),
+            "cpu_usage": rng.uniform(30, 95),
+            "memory_usage": rng.uniform(40, 80),
+            "network_in": rng.uniform(10, 600),
+            "network_out": rng.uniform(5, 450),
+            "disk_usage": rng.uniform(45, 75),
+            "response_time": rng.uniform(50, 1000),
+            "active_users": rng.randint(100, 500),
+            "error_rate": rng.uniform(0, 3.5),
+        }
+        for i in range(window_seconds - 1)
+    ]
+
+
+def app3_scenario(params):
+    window_seconds = APP3_WINDOW_SECONDS[params["time_window"]]
+
+    def setup():
+        at = AppTest.from_file(str(APPS_DIR / "app3" / "app.py"), default_timeout=TIMEOUT)
+        at.session_state["history_data"] = make_history(window_seconds)
+        check(at.run())
+        widget(at.sidebar.selectbox, "データ表示期間").set_value(params["time_window"])
+        for name, label in APP3_MONITOR_LABELS.items():
+            widget(at.sidebar.checkbox, label).set_value(name in params["monitored"])
+        return at
+
+    def rerun(at):
+        # 1ティックで新しいサンプルが1件増えるので、リランごとに履歴を表示期間分へ戻す
+        at.session_state["history_data"] = make_history(window_seconds)
+        return check(at.run())
+
+    return setup, rerun
+
+
+SCENARIOS = {
+    "app1": (APP1_GRID, app1_scenario),
+    "app2": (APP2_GRID, app2_scenario),
+    "app3": (APP3_GRID, app3_scenario),
+}
+
+
+def is_valid(app, params):
+    if app == "app2":
+        return params["algorithm"] in APP2_ALGORITHMS[params["task_type"]]
+    return True
+
+
+def case_id(app, params):
+    parts = []
+    for key, value in params.items():
+        if isinstance(value, (list, tuple)):
+            value = "+".join(value)
+        parts.append(f"{key}={value}")
+    return f"{app}[{','.join(parts)}]"
+
+
+def measure(app, params, repeats):
+    """1ケースを計測: コールド1回、ウォーム repeats 回、tracemalloc 付きで1回"""
+    setup, rerun = SCENARIOS[app][1](params)
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    # データ生成・集計関数は bounded_cache に移ったため、こちらも空にする
+    for cache in bounded_cache.CACHES.values():
+        cache.clear()
+    at = setup()
+    gc.collect()
+    start = time.perf_counter()
+    rerun(at)
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rerun(at)
+        warm.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        rerun(at)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "cold_ms": cold * 1000,
+        "warm_ms": statistics.median(warm) * 1000,
+        "warm_min_ms": min(warm) * 1000,
+        "peak_mib": peak / 2**20,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ウォーム中央値とピークメモリが tolerance を超えて悪化したケースを返す"""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        for key in ("warm_ms", "peak_mib"):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append((case, key, base[key], result[key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="3アプリのヘッドレス・リラン遅延ベンチマーク")
+    parser.add_argument("--app", choices=sorted(SCENARIOS), action="append",
+                        help="対象アプリ（複数指定可、既定は全アプリ）")
+    parser.add_argument("--quick", action="store_true", help="縮小グリッドで実行")
+    parser.add_argument("--repeats", type=int, default=3, help="ウォームリランの回数")
+    parser.add_argument("--output", type=Path, help="結果を JSON で保存するパス")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="結果をベースラインとして保存")
+    parser.add_argument("--compare", action="store_true", help="ベースラインと比較する")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="回帰とみなす悪化率（既定 0.25 = 25%%）")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<90}{'cold ms':>10}{'warm ms':>10}{'peak MiB':>10}")
+    for app in args.app or sorted(SCENARIOS):
+        grid = QUICK_GRIDS[app] if args.quick else SCENARIOS[app][0]
+        for params in grid_points(grid):
+            if not is_valid(app, params):
+                continue
+            case = case_id(app, params)
+            result = measure(app, params, args.repeats)
+            results[case] = result
+            print(f"{case:<90}{result['cold_ms']:>10.1f}{result['warm_ms']:>10.1f}{result['peak_mib']:>10.2f}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"ベースラインを保存しました: {args.baseline}")
+
+    if args.compare:
+        if not args.baseline.exists():
+            sys.exit(f"ベースラインがありません: {args.baseline}（--save-baseline で作成）")
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n⚠️ 回帰を検出しました:")
+            for case, key, before, after in regressions:
+                print(f"  {case} {key}: {before:.2f} -> {after:.2f} ({after / before - 1:+.0%})")
+            sys.exit(1)
+        print("\n✅ 回帰なし")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""docker-compose 構成向けの同時セッション負荷テスト
+
+nginx のフロントドア（/app1, /app2, /app3）経由で Streamlit の WebSocket セッションを N 本張り、
+ウィジェット操作を再生してリラン遅延（p50/p95/p99）、1更新あたりのバイト数、
+1セッションあたりのサーバーメモリを計測する。
+
+使い方:
+    # docker-compose up 済みの nginx に対して実行
+    python benchmarks/load_test.py --target http://localhost --sessions 20
+
+    # 実デプロイなしで、ローカルに各アプリの Streamlit サーバーを立てて実行
+    python benchmarks/load_test.py --local --sessions 10 --interactions 5
+
+    # 統合構成（apps/combined/app.py、1サーバーに3ページ）を対象にする
+    python benchmarks/load_test.py --combined --target http://localhost
+    python benchmarks/load_test.py --combined --local
+
+プロトコルは Streamlit の protobuf（streamlit.proto）をそのまま使うため、
+負荷生成側とサーバー側の Streamlit バージョンを揃えること。
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib.parse import urlparse
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+
+ROOT = Path(__file__).resolve().parent.parent
+APPS = ("app1", "app2", "app3")
+LOCAL_BASE_PORT = 8601
+
+
+# ----------------------------------------------------------------------------
+# アプリごとの操作シナリオ: (ウィジェット種別, ラベル, 値を選ぶ関数)
+# ----------------------------------------------------------------------------
+SCENARIOS = {
+    "app1": [
+        ("slider", "データポイント数", lambda rng: rng.choice([100, 250, 500, 750, 1000])),
+        ("selectbox", "グラフタイプ", lambda rng: rng.choice(["線グラフ", "棒グラフ", "散布図", "ヒートマップ"])),
+        ("radio", "分析タイプを選択:", lambda rng: rng.choice(["トレンド分析", "分布分析", "相関分析"])),
+        ("slider", "移動平均期間", lambda rng: rng.choice([5, 10, 20, 30, 50])),
+        ("multiselect", "カテゴリー選択",
+         lambda rng: rng.sample(["売上", "利益", "顧客数", "製品数"], rng.randint(1, 4))),
+    ],
+    "app2": [
+        ("slider", "サンプル数", lambda rng: rng.choice([200, 500, 1000, 2000])),
+        ("slider", "特徴量数", lambda rng: rng.choice([5, 10, 20])),
+        ("selectbox", "🔧 アルゴリズム",
+         lambda rng: rng.choice(["Random Forest", "Logistic Regression", "Decision Tree"])),
+        ("button", "🚀 モデル実行", None),
+    ],
+    "app3": [
+        ("checkbox", "💻 CPU使用率", lambda rng: rng.random() < 0.8),
+        ("checkbox", "🌐 ネットワーク", lambda rng: rng.random() < 0.8),
+        ("selectbox", "データ表示期間", lambda rng: rng.choice(["1分", "5分", "10分"])),
+    ],
+}
+
+def encode_widget_state(kind, proto, value):
+    """フロントエンドと同じ形式でウィジェットの値を WidgetState にエンコードする
+
+    選択系ウィジェットは Streamlit のバージョンによって、インデックス（旧）と
+    表示ラベル（raw_value を持つ新しい proto）のどちらで送るかが異なる。
+    """
+    state = WidgetState()
+    state.id = proto.id
+    fields = proto.DESCRIPTOR.fields_by_name
+    options = list(getattr(proto, "options", []))
+    if kind == "button":
+        state.trigger_value = True
+    elif kind == "checkbox":
+        state.bool_value = bool(value)
+    elif kind == "slider":
+        state.double_array_value.data[:] = [float(value)]
+    elif kind in ("selectbox", "radio"):
+        if "raw_value" in fields:
+            state.string_value = value
+        else:
+            state.int_value = options.index(value)
+    elif kind == "multiselect":
+        if "raw_values" in fields:
+            state.string_array_value.data[:] = value
+        else:
+            state.int_array_value.data[:] = [options.index(v) for v in value]
+    else:
+        raise ValueError(f"未対応のウィジェットです: {kind}")
+    return state
+
+
+# app3 は自動更新ループでスクリプトが終わらないため、各ティックの最後に描画される要素
+# （「最終更新」の表示）が届いた時点を描画完了とみなす。グラフは履歴が2件以上になる2ティック目
+# （更新間隔ぶん後）まで描画されないため、グラフを目印にすると初回の接続で更新間隔を測ってしまう
+STREAMING_MARKERS = {"app3": "最終更新"}
+
+
+@dataclass
+class SessionStats:
+    app: str
+    latencies: list = field(default_factory=list)
+    update_bytes: list = field(default_factory=list)
+    stream_bytes: int = 0
+    stream_seconds: float = 0.0
+    errors: int = 0
+
+
+class StreamlitSession:
+    """1本の WebSocket セッション（ブラウザタブ1つに相当）"""
+
+    def __init__(self, url, app, page_name=""):
+        self.url = url
+        self.app = app
+        self.ws = None
+        self.messages = []
+        self.widget_states = {}
+        self.page_script_hash = ""
+        # 統合構成（combined/app.py）では URL のパス（app1 など）でページを指定する
+        self.page_name = page_name
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, widget_states=None, fragment_id="", timeout=120):
+        """リランを要求し、描画完了までの (遅延秒, 受信バイト数) を返す
+
+        fragment_id を指定すると、ブラウザがフラグメント（st.fragment）内のウィジェット操作で送るのと
+        同じく、そのフラグメントだけを再実行させる。
+        """
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        if not self.page_script_hash:
+            msg.rerun_script.page_name = self.page_name
+        if widget_states is not None:
+            msg.rerun_script.widget_states.CopyFrom(widget_states)
+        msg.rerun_script.fragment_id = fragment_id
+
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        previous, self.messages = self.messages, []
+        received = 0
+        # フラグメント単体の再実行では new_session が送られない
+        started = bool(fragment_id)
+        async with asyncio.timeout(timeout):
+            while True:
+                raw = await self.ws.recv()
+                received += len(raw)
+                fwd = ForwardMsg()
+                fwd.ParseFromString(raw)
+                kind = fwd.WhichOneof("type")
+                if kind == "new_session":
+                    # new_session 以前のメッセージは中断された前回の実行の残り
+                    started = True
+                    self.page_script_hash = fwd.new_session.page_script_hash
+                elif not started:
+                    continue
+                elif kind == "delta":
+                    self.messages.append(fwd)
+                    if self._is_tick_end(fwd):
+                        break
+                elif kind == "script_finished":
+                    break
+        if fragment_id:
+            # 再実行されなかった要素は再送されないので、前回までのウィジェットも探せるよう残す
+            rerendered = {fragment_id} | {fwd.delta.fragment_id for fwd in self.messages}
+            self.messages.extend(fwd for fwd in previous if fwd.delta.fragment_id not in rerendered)
+        return time.perf_counter() - start, received
+
+    def _is_tick_end(self, fwd):
+        marker = STREAMING_MARKERS.get(self.app)
+        if marker is None or fwd.delta.WhichOneof("type") != "new_element":
+            return False
+        element = fwd.delta.new_element
+        return element.WhichOneof("type") == "markdown" and marker in element.markdown.body
+
+    async def drain(self, seconds):
+        """思考時間の間に届いたメッセージ（app3 の自動更新）のバイト数を数える"""
+        received = 0
+        deadline = time.perf_counter() + seconds
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return received
+            try:
+                raw = await asyncio.wait_for(self.ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                return received
+            received += len(raw)
+
+    def widget_states_after(self, kind, label, value):
+        """1つのウィジェットを操作した後、サーバーへ送る (WidgetStates, フラグメント ID) を返す
+
+        ブラウザと同じく、これまでに変更したウィジェットの状態をすべて送る
+        （送らなかったウィジェットはデフォルト値に戻るため）。ボタンのトリガーは1回限り。
+        フラグメント ID はウィジェットがフラグメントの外にあれば空文字列。
+        """
+        for fwd in self.messages:
+            if fwd.delta.WhichOneof("type") != "new_element":
+                continue
+            element = fwd.delta.new_element
+            if element.WhichOneof("type") != kind or getattr(element, kind).label != label:
+                continue
+            state = encode_widget_state(kind, getattr(element, kind), value)
+
+            states = WidgetStates()
+            states.widgets.extend(w for w in self.widget_states.values() if w.id != state.id)
+            states.widgets.append(state)
+            if kind != "button":
+                self.widget_states[state.id] = state
+            return states, fwd.delta.fragment_id
+        return None
+
+
+async def run_session(url, app, interactions, think_time, seed, stats, page_name=""):
+    rng = random.Random(seed)
+    session = StreamlitSession(url, app, page_name)
+    try:
+        await session.connect()
+        latency, nbytes = await session.rerun()
+        stats.latencies.append(latency)
+        stats.update_bytes.append(nbytes)
+
+        for _ in range(interactions):
+            idle = rng.uniform(0.5, 1.5) * think_time
+            stats.stream_bytes += await session.drain(idle)
+            stats.stream_seconds += idle
+
+            kind, label, choose = rng.choice(SCENARIOS[app])
+            found = session.widget_states_after(kind, label, choose(rng) if choose else None)
+            if found is None:
+                continue
+            latency, nbytes = await session.rerun(*found)
+            stats.latencies.append(latency)
+            stats.update_bytes.append(nbytes)
+        return session
+    except Exception as exc:  # noqa: BLE001 - 負荷試験では失敗を数えて継続する
+        stats.errors += 1
+        print(f"[{app}] session error: {exc!r}", file=sys.stderr)
+        await session.close()
+        return None
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def read_rss(pid):
+    """Linux の /proc からプロセスの RSS（バイト）を読む"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def stream_url(base_url, app, combined=False):
+    parsed = urlparse(base_url)
+    scheme = "wss" if parsed.scheme == "https" else "ws"
+    if combined:
+        # 統合構成では全ページが1つのサーバーのルートを共有する
+        return f"{scheme}://{parsed.netloc}/_stcore/stream"
+    return f"{scheme}://{parsed.netloc}/{app}/_stcore/stream"
+
+
+def wait_healthy(health_url, proc, name, timeout=60):
+    """/_stcore/health が 200 を返すまで待つ"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(health_url, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        if proc.poll() is not None or time.time() > deadline:
+            raise RuntimeError(f"{name} のローカルサーバーが起動しませんでした")
+        time.sleep(0.5)
+
+
+def launch_server(script, port, base_url_path=""):
+    args = [
+        sys.executable, "-m", "streamlit", "run", str(script),
+        f"--server.port={port}", "--server.headless=true",
+        "--server.enableCORS=false", "--server.enableXsrfProtection=false",
+        "--browser.gatherUsageStats=false",
+    ]
+    if base_url_path:
+        args.append(f"--server.baseUrlPath={base_url_path}")
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_combined_server(apps, port=LOCAL_BASE_PORT):
+    """統合エントリーポイントを1つ起動し、全アプリが同じサーバー（プロセス）を指すようにする"""
+    proc = launch_server(ROOT / "apps" / "combined" / "app.py", port)
+    base_url = f"http://localhost:{port}"
+    wait_healthy(f"{base_url}/_stcore/health", proc, "combined")
+    return {app: (base_url, proc) for app in apps}
+
+
+def start_local_servers(apps):
+    """実デプロイの代わりに、各アプリを nginx と同じパス（/appN）で個別ポートに起動する"""
+    servers = {}
+    for i, app in enumerate(apps):
+        port = LOCAL_BASE_PORT + i
+        proc = launch_server(ROOT / "apps" / app / "app.py", port, f"/{app}")
+        servers[app] = (f"http://localhost:{port}", proc)
+
+    for app, (base_url, proc) in servers.items():
+        wait_healthy(f"{base_url}/{app}/_stcore/health", proc, app)
+    return servers
+
+
+async def run_load(targets, sessions, interactions, think_time, ramp, pids, combined=False):
+    results = {}
+    page_name = ""
+    for app, base_url in targets.items():
+        url = stream_url(base_url, app, combined)
+        if combined:
+            page_name = app
+        # 初回インポートやキャッシュ作成をセッション単価に含めないよう、1セッション分ウォームアップする
+        warmup = await run_session(url, app, 0, 0, seed=-1, stats=SessionStats(app), page_name=page_name)
+        if warmup is not None:
+            await warmup.close()
+        rss_before = read_rss(pids[app]) if app in pids else None
+
+        stats = [SessionStats(app) for _ in range(sessions)]
+        tasks = []
+        for i in range(sessions):
+            tasks.append(asyncio.create_task(
+                run_session(url, app, interactions, think_time, seed=i, stats=stats[i], page_name=page_name)
+            ))
+            if ramp:
+                await asyncio.sleep(ramp / sessions)
+        open_sessions = [s for s in await asyncio.gather(*tasks) if s is not None]
+
+        # 全セッションを開いたままメモリを計測してから閉じる
+        rss_after = read_rss(pids[app]) if app in pids else None
+        for session in open_sessions:
+            await session.close()
+
+        latencies = [x for s in stats for x in s.latencies]
+        update_bytes = [x for s in stats for x in s.update_bytes]
+        stream_seconds = sum(s.stream_seconds for s in stats)
+        results[app] = {
+            "sessions": sessions,
+            "reruns": len(latencies),
+            "errors": sum(s.errors for s in stats),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "bytes_per_update": sum(update_bytes) / len(update_bytes) if update_bytes else 0,
+            "stream_bytes_per_s": (sum(s.stream_bytes for s in stats) / stream_seconds
+                                   if stream_seconds else 0),
+            "server_rss_per_session_mib": (
+                (rss_after - rss_before) / max(1, len(open_sessions)) / 2**20
+                if rss_before is not None and rss_after is not None else None
+            ),
+        }
+    return results
+
+
+def print_report(results):
+    print(f"{'app':<6}{'sessions':>9}{'reruns':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'KiB/update':>12}{'stream KiB/s':>14}{'MiB/session':>13}")
+    for app, r in results.items():
+        rss = r["server_rss_per_session_mib"]
+        print(f"{app:<6}{r['sessions']:>9}{r['reruns']:>8}{r['errors']:>8}"
+              f"{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['p99_ms']:>10.0f}"
+              f"{r['bytes_per_update'] / 1024:>12.1f}{r['stream_bytes_per_s'] / 1024:>14.1f}"
+              f"{(f'{rss:.2f}' if rss is not None else 'n/a'):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 同時セッション負荷テスト")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target", default="http://localhost",
+                        help="nginx（または ALB）のベース URL（既定: http://localhost）")
+    target.add_argument("--local", action="store_true",
+                        help="ローカルに各アプリの Streamlit サーバーを起動して対象にする")
+    parser.add_argument("--combined", action="store_true",
+                        help="統合構成（1サーバーに3ページ）が対象。/_stcore/stream に接続してページ名で開く")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=list(APPS))
+    parser.add_argument("--sessions", type=int, default=10, help="アプリごとの同時セッション数")
+    parser.add_argument("--interactions", type=int, default=5, help="セッションごとのウィジェット操作回数")
+    parser.add_argument("--think-time", type=float, default=1.0, help="操作間の平均待ち時間（秒）")
+    parser.add_argument("--ramp", type=float, default=2.0, help="全セッションを開き終えるまでの秒数")
+    parser.add_argument("--server-pid", action="append", default=[], metavar="APP=PID",
+                        help="メモリを計測するサーバープロセス（--local では自動）")
+    parser.add_argument("--output", type=Path, help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    pids = dict(item.split("=", 1) for item in args.server_pid)
+    pids = {app: int(pid) for app, pid in pids.items()}
+    servers = {}
+    try:
+        if args.local:
+            if args.combined:
+                servers = start_combined_server(args.apps)
+            else:
+                servers = start_local_servers(args.apps)
+            targets = {app: base_url for app, (base_url, _) in servers.items()}
+            pids.update({app: proc.pid for app, (_, proc) in servers.items()})
+        else:
+            targets = {app: args.target.rstrip("/") for app in args.apps}
+
+        results = asyncio.run(
+            run_load(targets, args.sessions, args.interactions, args.think_time, args.ramp, pids,
+                     args.combined)
+        )
+    finally:
+        for proc in {proc for _, proc in servers.values()}:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()